@@ -1,14 +1,23 @@
+import argparse
 import os
+import sys
 from dotenv import load_dotenv
-from netaddr import IPNetwork
 from prettytable import PrettyTable
 
-from modules.rule.check import check_rule_match
-from modules.rule.format import format_rule
+from modules.rule.diff import diff_pfs, parse_since
+from modules.rule.format import format_change, format_owner_dict, format_rule, format_verdict
+from modules.rule.bulk import run_flows
+from modules.rule.executor import QueryExecutor
+from modules.rule.report import ReportWriter
+from modules.rule.search import find_owners
+from modules.rule.verdict import FLOW_COMMANDS, Flow, verdict_pfs
+from modules.api import QueryAPI
 from modules.updater import check_update
 from modules.service.netbox import NetboxAPI
+from modules.service.fleet import PFSenseFleet
 from modules.service.pfsense import PFSense
 from modules.input_query import setup_readline, parse_search_query
+from modules.log import log_to_stderr, setup_file_log
 from modules.settings import read_settings
 
 # Fix Ctrl+C for IntelliJ IDEA
@@ -19,14 +28,42 @@ except ImportError:
 
 __GITHUB_UPDATE_URL = 'https://raw.githubusercontent.com/Reydan46/RulesTrackerPF/master/'
 __CURRENT_VERSION = '1.05'
-__COMMANDS = ['pf', 'act', 'desc', 'src', 'dst', 'port']
+__COMMANDS = ['pf', 'act', 'desc', 'src', 'dst', 'port', 'owner', 'since']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Search pfSense rules by specified criteria')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep configs in memory and refresh them in the background '
+                             '(interval is taken from the pfSense cache time in settings.yaml)')
+    parser.add_argument('--api', metavar='[HOST:]PORT',
+                        help='start the local HTTP/JSON query API (host defaults to 127.0.0.1)')
+    parser.add_argument('--verdict', action='store_true',
+                        help='find the rule deciding a flow (src, dst, proto, port, in) on each pfSense '
+                             'instead of searching rules')
+    parser.add_argument('--flows', metavar='FILE',
+                        help='check flows from a CSV/JSONL file ("-" for stdin) on all pfSense and exit')
+    parser.add_argument('--output', metavar='FILE', default='-',
+                        help='file for --flows results ("-" for stdout, default)')
+    parser.add_argument('--output-format', choices=['jsonl', 'csv'],
+                        help='format of --flows results (by default - by the output file extension, else jsonl)')
+    parser.add_argument('--no-report', action='store_true',
+                        help='do not save HTML/CSV reports of search results')
+    return parser.parse_args()
+
 
 if __name__ == '__main__':
+    setup_file_log()
+    args = parse_args()
+    if args.flows and args.output == '-':
+        # Результаты проверки потоков выводятся в stdout - логи переносятся в stderr
+        log_to_stderr()
     check_update(__GITHUB_UPDATE_URL, __CURRENT_VERSION)
 
     settings = read_settings()
 
     router_devices = []
+    router_networks = {}
     # Загрузка переменных окружения из .env
     load_dotenv(dotenv_path='.env')
     # Установка настроек
@@ -37,34 +74,127 @@ if __name__ == '__main__':
         if NetboxAPI.get_roles() and 'Router' in NetboxAPI.roles:
             # Получение устройств с ролью router (в нашем случае это все pfSense)
             router_devices = NetboxAPI.get_devices(
-                role=NetboxAPI.roles['Router'])
+                role_id=NetboxAPI.roles['Router'])
+            # Сети интерфейсов pfSense из NetBox (для поиска домашних pfSense)
+            router_networks = NetboxAPI.get_networks([name for name, _ in router_devices])
 
     PFSense.settings = settings
-    PFs = []
-    for router in router_devices:
-        pf = PFSense(
-            ip=router.primary_ip4.address.split('/')[0],
-            name=router.name
-        )
-        pf.run()
-        PFs.append(pf)
-
+    # Параллельная загрузка конфигураций всех pfSense
+    fleet = PFSenseFleet(router_devices, router_networks)
+    fleet.refresh()
+    if args.flows:
+        # Пакетная проверка потоков без интерактивного поиска
+        run_flows(fleet.pfs, args.flows, args.output, output_format=args.output_format)
+        sys.exit()
+
+    if args.daemon:
+        # Фоновое обновление конфигураций изменившихся pfSense
+        fleet.start(PFSenseFleet.get_interval(settings))
+
+    # Параллельный поиск по pfSense в нескольких процессах
+    executor = QueryExecutor(settings['search']['workers'] or os.cpu_count() or 1)
+    if executor.workers > 1:
+        executor.start()
+
+    api = None
+    if args.api:
+        api_host, _, api_port = args.api.rpartition(':')
+        api = QueryAPI(fleet, __COMMANDS, executor)
+        api.start(api_host or '127.0.0.1', int(api_port))
+
+    report = None
+    if settings['report']['enabled'] and not args.no_report:
+        # Отчёты записываются в фоне, не задерживая вывод результатов поиска
+        report = ReportWriter(settings['report']['dir'], settings['report']['workers'])
+
+    commands = FLOW_COMMANDS if args.verdict else __COMMANDS
     # Инициализация автозаполнения команд
-    setup_readline(__COMMANDS)
+    setup_readline(commands)
     # Поиск
     while True:
         try:
-            query = input('Enter query: ')
-            parsed_query, parsed_success = parse_search_query(query, __COMMANDS)
+            query = input('Enter flow: ' if args.verdict else 'Enter query: ')
+            parsed_query, parsed_success = parse_search_query(query, commands)
 
             os.system('cls' if os.name == 'nt' else 'clear')
         except KeyboardInterrupt:
             print('\nProgram terminated by user')
             break
+        except EOFError:
+            # Нет интерактивного ввода (например, запуск службой) - продолжаем обслуживать API
+            if api:
+                try:
+                    api.wait()
+                except KeyboardInterrupt:
+                    print('\nProgram terminated by user')
+            break
         if not parsed_success:
             input('Press Enter to continue...')
             continue
 
+        # Снимок pfSense, актуальный на момент запроса
+        PFs = fleet.pfs
+
+        # Решающее правило для потока на каждом pfSense
+        if args.verdict:
+            try:
+                flow = Flow.from_query(parsed_query)
+            except ValueError as e:
+                print(e)
+                continue
+            table = PrettyTable(["PF Name", "Ingress", "Verdict", "Tracker", "Floating", "Interface", "Source",
+                                 "Destination", "Ports", "Description", "Indeterminate"])
+            table.hrules = 1
+            table.max_width["Description"] = 30
+            table.max_width["Source"] = 20
+            table.max_width["Destination"] = 20
+            unknown_ingress = []
+            for pf, ingress, rule, indeterminate in verdict_pfs(PFs, flow, parsed_query['pf']):
+                if ingress is None:
+                    unknown_ingress.append(pf.name)
+                else:
+                    table.add_row(format_verdict(pf, ingress, rule, indeterminate))
+            print(table)
+            if unknown_ingress:
+                print(f"Ingress interface not determined: {', '.join(unknown_ingress)}")
+            continue
+
+        # Поиск pfSense, которым принадлежит IP
+        if parsed_query['owner']:
+            owners = find_owners(PFs, parsed_query['owner']['value'])
+            if owners is None:
+                print(f"Invalid IP: {parsed_query['owner']['value']}")
+                continue
+            table = PrettyTable(["PF Name", "Interface", "Network"])
+            for pf, interface in owners:
+                table.add_row(list(format_owner_dict(pf, interface).values()))
+            print(table)
+            continue
+
+        # Изменения правил pfSense с заданного времени
+        if parsed_query['since']:
+            since_time = parse_since(parsed_query['since']['value'])
+            if since_time is None:
+                print(f"Invalid time: {parsed_query['since']['value']}")
+                continue
+            table = PrettyTable(["PF Name", "Change", "Tracker", "Action", "Floating", "Interface", "Source",
+                                 "Destination", "Ports", "Description"])
+            table.hrules = 1
+            table.max_width["Description"] = 30
+            table.max_width["Source"] = 20
+            table.max_width["Destination"] = 20
+            diffs = list(diff_pfs(PFs, since_time, parsed_query['pf']))
+            for pf, _, old_config, changes in diffs:
+                for state, old_rule, new_rule in changes:
+                    if old_rule is not None:
+                        table.add_row(format_change(pf, old_config, 'chg_old' if new_rule else 'del', old_rule))
+                    if new_rule is not None:
+                        table.add_row(format_change(pf, pf.config, 'chg_new' if old_rule else 'add', new_rule))
+            print(table)
+            if report:
+                report.write_diff(diffs)
+            continue
+
         header = ["PF Name", "Num", "Tracker", "Action", "Floating", "Protocol", "Interface", "Source", "Destination",
                   "Ports", "Gateway", "Description"]
         table = PrettyTable(header)
@@ -76,50 +206,20 @@ if __name__ == '__main__':
         table.max_width["Source"] = 20
         table.max_width["Destination"] = 20
 
-        for pf in PFs:
-            num = 0
-            filtered_rules = []
-
-            # Определяем домашний ли pf по отношению к искомому ip
-            if parsed_query['src']:
-                home_pf = False
-                for interface in pf.config.interfaces:
-                    ip_network_string = interface.get_ip_obj()
-                    if ip_network_string and IPNetwork(parsed_query['src']['value']) in IPNetwork(ip_network_string):
-                        home_pf = True
-                        break
-            else:
-                # Если source не указан - считаем домашними все PFSense
-                home_pf = True
-
-            # Обработка правил floating (quick)
-            for rule in pf.config.filter:
-                if rule.floating_full == 'yes (quick)' and check_rule_match(rule, parsed_query, num, pf, table,
-                                                                            home_pf):
-                    filtered_rules.append(rule)
-                    num += 1
-            # Обработка правил интерфейсов
-            for rule in pf.config.filter:
-                if rule.floating == 'no' and check_rule_match(rule, parsed_query, num, pf, table, home_pf):
-                    filtered_rules.append(rule)
-                    num += 1
-            # Обработка правил floating (без quick)
-            for rule in pf.config.filter:
-                if rule.floating == 'yes' and rule.quick == '' and check_rule_match(rule, parsed_query, num, pf, table,
-                                                                                    home_pf):
-                    filtered_rules.append(rule)
-                    num += 1
-
-            pf.config.get_html(custom_rules=filtered_rules,
-                               save=True, filename=f"report\\html\\{pf.name}.html")
-
-            os.makedirs("report\\csv", exist_ok=True)
-            with open(f"report\\csv\\{pf.name}.csv", "w") as f:
-                f.write(';'.join(header) + '\n')
-                for rule in filtered_rules:
-                    f.write(';'.join(format_rule(pf, rule, num, csv=True)) + '  \n')
+        results = executor.search(PFs, parsed_query)
+        for pf, filtered_rules in results:
+            for num, rule in enumerate(filtered_rules):
+                table.add_row(format_rule(pf, rule, num))
 
             if filtered_rules and pf != PFs[-1]:
                 table.add_row(["-" * len(column) for column in table.field_names])
 
         print(table)
+
+        if report:
+            report.write(results)
+
+    if report:
+        # Дожидаемся записи отчётов по последнему запросу
+        report.close()
+    executor.stop()
@@ -0,0 +1,323 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from modules.input_query import parse_search_query
+from modules.log import logger
+from modules.rule.check import CompiledQuery
+from modules.rule.diff import diff_pfs, parse_since
+from modules.rule.format import format_change_dict, format_owner_dict, format_rule_dict
+from modules.rule.report import iter_csv, iter_diff_html, iter_html
+from modules.rule.search import find_owners, search_pfs
+from modules.rule.verdict import check_flow
+
+
+class QueryAPI:
+    """
+    Локальный HTTP/JSON API поиска правил по загруженным в память конфигурациям pfSense.
+
+    GET  /health               - состояние сервиса
+    GET  /query?q=<запрос>     - один запрос
+    GET  /report?q=<запрос>&format=csv|html - потоковый отчёт по всем pfSense
+    GET  /owner?ip=<IP>        - pfSense, которым принадлежит IP (запрос owner=<IP>)
+    GET  /diff?since=<время>&pf=<имя>&format=json|html - изменения правил с заданного времени (запрос since=<время>)
+    GET  /verdict?src=&dst=&proto=&port=&sport=&in=&pf= - решающее правило для потока на каждом pfSense
+    POST /verdict              - {"flows": [{"src": ..., "dst": ..., "proto": ..., "port": ..., "sport": ...,
+                                             "in": ...}, ...]}
+    POST /query                - {"query": "<запрос>"} или пакет {"queries": ["<запрос>", ...]}
+    """
+    # Максимальный размер тела запроса (в байтах)
+    max_body = 1024 * 1024
+
+    def __init__(self, fleet, commands, executor=None):
+        """
+        Args:
+            fleet (PFSenseFleet): Загруженные pfSense.
+            commands (list): Допустимые поля поискового запроса.
+            executor (QueryExecutor, optional): Параллельный поиск по pfSense.
+        """
+        self.fleet = fleet
+        self.commands = commands
+        self.executor = executor
+        self.server = None
+        self.__thread = None
+
+    def query(self, query_string, pfs=None):
+        """
+        Выполняет один поисковый запрос.
+
+        Args:
+            query_string (str): Поисковый запрос.
+            pfs (tuple, optional): Снимок pfSense. По умолчанию - актуальный на момент запроса.
+
+        Returns:
+            dict: Запрос, найденные правила (rows) и ошибка (error), если запрос не разобран.
+        """
+        parsed_query, parsed_success = parse_search_query(query_string, self.commands)
+        if not parsed_success:
+            return {'query': query_string, 'rows': [], 'error': 'Invalid query'}
+
+        if pfs is None:
+            pfs = self.fleet.pfs
+        if parsed_query.get('owner'):
+            return self.owner(parsed_query['owner']['value'], pfs, query_string)
+        if parsed_query.get('since'):
+            return self.diff(parsed_query['since']['value'], parsed_query['pf'], pfs, query_string)
+        rows = [
+            format_rule_dict(pf, rule, num)
+            for pf, filtered_rules in self.search(pfs, parsed_query)
+            for num, rule in enumerate(filtered_rules)
+        ]
+        return {'query': query_string, 'rows': rows, 'error': None}
+
+    def owner(self, ip, pfs=None, query_string=None):
+        """
+        Находит pfSense, которым принадлежит IP (в сеть интерфейса которых он входит).
+
+        Returns:
+            dict: Запрос, найденные интерфейсы pfSense (rows) и ошибка (error), если IP не разобран.
+        """
+        query_string = query_string if query_string is not None else f'owner={ip}'
+        owners = find_owners(self.fleet.pfs if pfs is None else pfs, ip)
+        if owners is None:
+            return {'query': query_string, 'rows': [], 'error': 'Invalid IP'}
+        return {'query': query_string, 'rows': [format_owner_dict(pf, interface) for pf, interface in owners],
+                'error': None}
+
+    def diff(self, since, pf_query=None, pfs=None, query_string=None):
+        """
+        Находит изменения правил на всех pfSense с заданного времени.
+
+        Args:
+            since (str): Время начала сравнения (30m, 12h, 7d, 2w или дата/время ISO).
+            pf_query (dict, optional): Условие на имя pfSense.
+            pfs (tuple, optional): Снимок pfSense. По умолчанию - актуальный на момент запроса.
+            query_string (str, optional): Исходный запрос.
+
+        Returns:
+            dict: Запрос, изменения правил (rows) и ошибка (error), если время не разобрано.
+        """
+        query_string = query_string if query_string is not None else f'since={since}'
+        since_time = parse_since(since)
+        if since_time is None:
+            return {'query': query_string, 'rows': [], 'error': 'Invalid time'}
+        rows = [
+            format_change_dict(pf, snapshot_time, old_config, state, old_rule, new_rule)
+            for pf, snapshot_time, old_config, changes in diff_pfs(self.fleet.pfs if pfs is None else pfs, since_time, pf_query)
+            for state, old_rule, new_rule in changes
+        ]
+        return {'query': query_string, 'rows': rows, 'error': None}
+
+    def verdict(self, flow_fields, pfs=None):
+        """
+        Определяет решающие правила для потока на всех pfSense.
+
+        Args:
+            flow_fields (dict): Поля потока (FLOW_COMMANDS).
+            pfs (tuple, optional): Снимок pfSense. По умолчанию - актуальный на момент запроса.
+
+        Returns:
+            dict: Поток, решения pfSense (rows), pfSense, на которых не определён входящий интерфейс
+                  (unknown_ingress), и ошибка (error), если поток не разобран.
+        """
+        return check_flow(self.fleet.pfs if pfs is None else pfs, flow_fields)
+
+    def search(self, pfs, parsed_query):
+        """
+        Ищет правила по разобранному запросу (в рабочих процессах, если они запущены).
+        """
+        if self.executor is not None:
+            return self.executor.search(pfs, parsed_query)
+        return search_pfs(pfs, CompiledQuery(parsed_query))
+
+    def report(self, query_string, report_format='csv'):
+        """
+        Формирует отчёт по результатам поискового запроса.
+
+        Args:
+            query_string (str): Поисковый запрос.
+            report_format (str): Формат отчёта (csv или html).
+
+        Returns:
+            iterable: Фрагменты отчёта или None, если запрос не разобран.
+        """
+        parsed_query, parsed_success = parse_search_query(query_string, self.commands)
+        if not parsed_success:
+            return None
+
+        results = self.search(self.fleet.pfs, parsed_query)
+        return iter_html(results) if report_format == 'html' else iter_csv(results)
+
+    def query_batch(self, query_strings):
+        """
+        Выполняет пакет поисковых запросов на одном снимке pfSense.
+        """
+        pfs = self.fleet.pfs
+        return [self.query(query_string, pfs) for query_string in query_strings]
+
+    def start(self, host, port):
+        """
+        Запускает HTTP-сервер в фоновом потоке.
+        """
+        self.server = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.server.serve_forever, name='query-api', daemon=True)
+        self.__thread.start()
+        logger.info(f"Query API is listening on http://{host}:{self.server.server_port}")
+
+    def wait(self):
+        """
+        Ожидает остановки HTTP-сервера.
+        """
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def stop(self):
+        """
+        Останавливает HTTP-сервер.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.wait()
+        self.__thread = None
+
+    def __make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive: клиент может отправлять запросы по одному соединению
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело ответа отправляются одним пакетом без задержки
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                try:
+                    self.handle_get()
+                except Exception as e:
+                    logger.exception(f"API request failed: {e}")
+                    self.send_json(500, {'error': 'Internal error'})
+
+            def do_POST(self):
+                try:
+                    self.handle_post()
+                except Exception as e:
+                    logger.exception(f"API request failed: {e}")
+                    self.send_json(500, {'error': 'Internal error'})
+
+            def handle_get(self):
+                url = urlparse(self.path)
+                match url.path:
+                    case '/health':
+                        self.send_json(200, {'status': 'ok', 'pfsense': len(api.fleet.pfs)})
+                    case '/query':
+                        query_string = parse_qs(url.query).get('q', [''])[0]
+                        self.send_json(200, api.query(query_string))
+                    case '/verdict':
+                        params = parse_qs(url.query)
+                        self.send_json(200, api.verdict({key: value[0] for key, value in params.items()}))
+                    case '/owner':
+                        self.send_json(200, api.owner(parse_qs(url.query).get('ip', [''])[0]))
+                    case '/diff':
+                        params = parse_qs(url.query)
+                        since = params.get('since', [''])[0]
+                        pf_query = {'method': '+', 'value': params['pf'][0]} if params.get('pf') else None
+                        if params.get('format', ['json'])[0] != 'html':
+                            self.send_json(200, api.diff(since, pf_query))
+                            return
+                        since_time = parse_since(since)
+                        if since_time is None:
+                            self.send_json(400, {'error': 'Invalid time'})
+                            return
+                        self.send_chunked(200, 'text/html; charset=utf-8',
+                                          iter_diff_html(diff_pfs(api.fleet.pfs, since_time, pf_query)))
+                    case '/report':
+                        params = parse_qs(url.query)
+                        report_format = params.get('format', ['csv'])[0]
+                        if report_format not in ('csv', 'html'):
+                            self.send_json(400, {'error': 'Expected format csv or html'})
+                            return
+                        chunks = api.report(params.get('q', [''])[0], report_format)
+                        if chunks is None:
+                            self.send_json(400, {'error': 'Invalid query'})
+                            return
+                        self.send_chunked(200, f'text/{report_format}; charset=utf-8', chunks)
+                    case _:
+                        self.send_json(404, {'error': 'Not found'})
+
+            def handle_post(self):
+                path = urlparse(self.path).path
+                if path not in ('/query', '/verdict'):
+                    self.send_json(404, {'error': 'Not found'})
+                    return
+
+                length = self.headers.get('Content-Length') or '0'
+                if not (length.isascii() and length.isdigit()):
+                    # Тело запроса не читается - соединение не может быть использовано повторно
+                    self.close_connection = True
+                    self.send_json(400, {'error': 'Invalid Content-Length'})
+                    return
+                length = int(length)
+                if length > api.max_body:
+                    self.close_connection = True
+                    self.send_json(413, {'error': 'Request is too large'})
+                    return
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self.send_json(400, {'error': 'Invalid JSON'})
+                    return
+
+                if path == '/verdict':
+                    if isinstance(body, dict) and isinstance(body.get('flows'), list):
+                        pfs = api.fleet.pfs
+                        self.send_json(200, {'results': [
+                            api.verdict(flow, pfs) if isinstance(flow, dict) else
+                            {'flow': flow, 'rows': [], 'unknown_ingress': [], 'error': 'Expected flow object'}
+                            for flow in body['flows']]})
+                    else:
+                        self.send_json(400, {'error': 'Expected "flows" list'})
+                elif isinstance(body, dict) and isinstance(body.get('queries'), list):
+                    self.send_json(200, {'results': api.query_batch([str(i) for i in body['queries']])})
+                elif isinstance(body, dict) and isinstance(body.get('query'), str):
+                    self.send_json(200, api.query(body['query']))
+                else:
+                    self.send_json(400, {'error': 'Expected "query" string or "queries" list'})
+
+            def send_json(self, status, data):
+                payload = json.dumps(data, ensure_ascii=False).encode('UTF-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_chunked(self, status, content_type, chunks):
+                # Отчёт передаётся по мере формирования (Transfer-Encoding: chunked)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        data = chunk.encode('UTF-8')
+                        if data:
+                            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                except Exception as e:
+                    # Заголовки уже отправлены - обрываем соединение без завершающего фрагмента
+                    logger.exception(f"API report failed: {e}")
+                    self.close_connection = True
+                    return
+                self.wfile.write(b'0\r\n\r\n')
+
+            def log_request(self, code='-', size='-'):
+                # Успешные запросы не логируются, чтобы не замедлять обработку
+                pass
+
+            def log_message(self, format, *args):
+                logger.warning(f"API {self.address_string()} {format % args}")
+
+        return Handler
@@ -1,34 +1,278 @@
 import datetime
+import hashlib
+import json
+import mmap
 import os
 import pickle
+import struct
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+
+from modules.log import logger
 
 __cache_folder = "cache_data"
+# Сигнатура файла кэша; файлы без неё (в том числе прежние pickle-файлы) считаются отсутствующими
+__cache_magic = b"RTPFCACHE1\n"
+# Длина JSON-заголовка
+__header_size = struct.Struct(">I")
+# Хранилище конфигураций: файлы с именем по хешу SHA-256 содержимого
+__store_folder = os.path.join(__cache_folder, "configs")
+# Размер блока при записи конфигурации в хранилище
+__store_block_size = 1024 * 1024
+
+
+def __write_atomic(path, chunks):
+    """
+    Записывает файл через временный файл в том же каталоге и переименование.
+
+    Args:
+        path (str): Путь к файлу.
+        chunks (iterable): Блоки содержимого (bytes).
+    """
+    folder = os.path.dirname(path)
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
+    fd, temp_file = tempfile.mkstemp(dir=folder, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+        os.replace(temp_file, path)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
+
+
+def __encode(value, codec):
+    match codec:
+        case "raw":
+            return value.encode("UTF-8")
+        case "json":
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("UTF-8")
+        case "pickle":
+            return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    raise ValueError(f"Unknown cache codec: {codec}")
+
+
+def __decode(payload, codec):
+    match codec:
+        case "raw":
+            return payload.decode("UTF-8")
+        case "json":
+            return json.loads(payload)
+        case "pickle":
+            return pickle.loads(payload)
+    raise ValueError(f"Unknown cache codec: {codec}")
+
+
+def __read_header(file):
+    if file.read(len(__cache_magic)) != __cache_magic:
+        return None
+    size_data = file.read(__header_size.size)
+    if len(size_data) != __header_size.size:
+        return None
+    header = json.loads(file.read(__header_size.unpack(size_data)[0]))
+    return header if isinstance(header, dict) else None
 
 
-def cache_get(cache_file, days=0, hours=0, minutes=0):
-    cache_expiry = datetime.timedelta(days=days, hours=hours, minutes=minutes)
+def __read_cache(cache_file, version=None, payload=True, days=None, hours=0, minutes=0):
+    """
+    Читает заголовок файла кэша и, если он подходит, значение.
+
+    Args:
+        cache_file (str): Имя файла кэша.
+        version (optional): Ожидаемая версия формата значения.
+        payload (bool): Читать ли значение (иначе - только заголовок).
+        days, hours, minutes: Время жизни кэша (None - без учёта времени жизни).
+
+    Returns:
+        dict | None: Заголовок (и значение в "value") или None, если кэш отсутствует, устарел или повреждён.
+    """
     cache_file = os.path.join(__cache_folder, cache_file)
-    if os.path.exists(cache_file):
+    if not os.path.exists(cache_file):
+        return None
+    try:
         with open(cache_file, "rb") as file:
-            cache_data = pickle.load(file)
-            timestamp = cache_data.get("timestamp")
-            if (
-                    cache_data is not None
-                    and "timestamp" in cache_data
-                    and isinstance(timestamp, datetime.datetime)
-                    and datetime.datetime.now() - timestamp <= cache_expiry
-                    and "value" in cache_data
-            ):
-                return cache_data["value"]
-    return None
-
-
-def cache_set(value, cache_file):
+            header = __read_header(file)
+            if header is None or header.get("version") != version:
+                return None
+            # Свежесть проверяется по заголовку, не читая значение
+            if days is not None:
+                cache_expiry = datetime.timedelta(days=days, hours=hours, minutes=minutes)
+                if time.time() - header.get("timestamp", 0) > cache_expiry.total_seconds():
+                    return None
+            if not payload:
+                return header
+
+            data = file.read()
+        if len(data) != header["size"] or hashlib.sha256(data).hexdigest() != header["hash"]:
+            logger.warning(f"Cache file {cache_file} is corrupted")
+            return None
+        if header.get("compressed"):
+            data = zlib.decompress(data)
+        header["value"] = __decode(data, header["codec"])
+        return header
+    except Exception as e:
+        logger.warning(f"Failed to read cache file {cache_file}. Error: {e}")
+        return None
+
+
+def cache_get(cache_file, days=0, hours=0, minutes=0, version=None):
+    cache_data = __read_cache(cache_file, version, days=days, hours=hours, minutes=minutes)
+    return cache_data["value"] if cache_data is not None else None
+
+
+def cache_load(cache_file, version=None):
+    """
+    Возвращает значение из кэша без учёта времени его жизни
+    """
+    cache_data = __read_cache(cache_file, version)
+    return cache_data["value"] if cache_data is not None else None
+
+
+def cache_info(cache_file, version=None):
+    """
+    Возвращает заголовок кэша без чтения значения (без учёта времени жизни).
+
+    Returns:
+        dict | None: timestamp, codec, compressed, size, hash и meta или None, если кэша нет.
+    """
+    return __read_cache(cache_file, version, payload=False)
+
+
+def cache_set(value, cache_file, version=None, codec="pickle", compress=False, meta=None):
+    """
+    Атомарно сохраняет значение в кэш: файл записывается во временный и затем переименовывается,
+    поэтому прерванная запись не оставляет повреждённого файла.
+
+    Args:
+        value: Значение.
+        cache_file (str): Имя файла кэша.
+        version (optional): Версия формата значения.
+        codec (str): Формат значения: pickle, json или raw (строка).
+        compress (bool): Сжимать ли значение (zlib).
+        meta (dict, optional): Дополнительные данные заголовка (доступны через cache_info).
+
+    Returns:
+        bool: True, если значение сохранено; ошибки кодирования и записи записываются в лог.
+    """
     cache_file = os.path.join(__cache_folder, cache_file)
-    cache_data = {"value": value, "timestamp": datetime.datetime.now()}
+    try:
+        data = __encode(value, codec)
+        if compress:
+            data = zlib.compress(data, 6)
+        header = json.dumps({
+            "version": version,
+            "timestamp": time.time(),
+            "codec": codec,
+            "compressed": compress,
+            "size": len(data),
+            "hash": hashlib.sha256(data).hexdigest(),
+            "meta": meta,
+        }).encode("UTF-8")
+
+        __write_atomic(cache_file, (__cache_magic, __header_size.pack(len(header)), header, data))
+    except Exception as e:
+        logger.warning(f"Failed to write cache file {cache_file}. Error: {e}")
+        return False
+    return True
+
+
+def __store_path(config_hash):
+    return os.path.join(__store_folder, f"{config_hash}.xml")
+
+
+def store_exists(config_hash):
+    """
+    Проверяет, есть ли конфигурация с заданным хешем в хранилище.
+    """
+    return bool(config_hash) and os.path.exists(__store_path(config_hash))
+
+
+def store_put(file):
+    """
+    Сохраняет конфигурацию в хранилище, читая её блоками из файла.
+
+    Конфигурация записывается во временный файл с одновременным вычислением хеша
+    и переименовывается по хешу; одинаковые конфигурации хранятся в одном экземпляре.
+
+    Args:
+        file (file): Открытый на чтение (в двоичном режиме) файл конфигурации.
+
+    Returns:
+        str: Хеш SHA-256 конфигурации.
+    """
+    digest = hashlib.sha256()
+    if not os.path.exists(__store_folder):
+        os.makedirs(__store_folder, exist_ok=True)
+
+    fd, temp_file = tempfile.mkstemp(dir=__store_folder, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp:
+            while chunk := file.read(__store_block_size):
+                digest.update(chunk)
+                temp.write(chunk)
+        config_hash = digest.hexdigest()
+        if os.path.exists(__store_path(config_hash)):
+            os.unlink(temp_file)
+        else:
+            os.replace(temp_file, __store_path(config_hash))
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.unlink(temp_file)
+        raise
+    return config_hash
+
+
+@contextmanager
+def store_open(config_hash):
+    """
+    Отображает конфигурацию из хранилища в память (только для чтения).
+
+    Args:
+        config_hash (str): Хеш SHA-256 конфигурации.
+
+    Yields:
+        mmap.mmap | bytes: Содержимое конфигурации.
+
+    Raises:
+        OSError: Если конфигурации нет в хранилище.
+    """
+    with open(__store_path(config_hash), "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            yield b""
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def store_prune(keep, days):
+    """
+    Удаляет из хранилища конфигурации, на которые нет ссылок, записанные раньше заданного срока.
 
-    if not os.path.exists(__cache_folder):
-        os.makedirs(__cache_folder)
+    Args:
+        keep (set): Хеши конфигураций, которые нужно сохранить.
+        days (float): Срок хранения (в днях).
 
-    with open(cache_file, "wb") as file:
-        pickle.dump(cache_data, file)
+    Returns:
+        int: Количество удалённых конфигураций.
+    """
+    if not os.path.exists(__store_folder):
+        return 0
+    cutoff = time.time() - datetime.timedelta(days=days).total_seconds()
+    removed = 0
+    for filename in os.listdir(__store_folder):
+        config_hash, ext = os.path.splitext(filename)
+        path = os.path.join(__store_folder, filename)
+        if ext != ".xml" or config_hash in keep:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"Failed to remove config {path}. Error: {e}")
+    return removed
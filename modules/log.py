@@ -25,9 +25,22 @@ c_format = colorlog.ColoredFormatter(c_format, log_colors=log_colors, datefmt='%
 c_handler.setFormatter(c_format)
 logger.addHandler(c_handler)
 
-# Создаем и добавляем обработчик для записи логов в файл '__loger__name__.log'
-f_handler = logging.FileHandler(f'{__loger__name__}.log', mode='w', encoding='utf-8')
-f_format = logging.Formatter(
-    "[%(asctime)s.%(msecs)03d - %(funcName)23s() ] %(message)s", datefmt='%d.%m.%Y %H:%M:%S')
-f_handler.setFormatter(f_format)
-logger.addHandler(f_handler)
+
+def setup_file_log():
+    """
+    Добавляет обработчик для записи логов в файл '__loger__name__.log' (файл перезаписывается).
+    Вызывается только в основном процессе: процессы поиска импортируют модуль заново
+    и не должны перезаписывать лог.
+    """
+    f_handler = logging.FileHandler(f'{__loger__name__}.log', mode='w', encoding='utf-8')
+    f_format = logging.Formatter(
+        "[%(asctime)s.%(msecs)03d - %(funcName)23s() ] %(message)s", datefmt='%d.%m.%Y %H:%M:%S')
+    f_handler.setFormatter(f_format)
+    logger.addHandler(f_handler)
+
+
+def log_to_stderr():
+    """
+    Переключает вывод логов в консоль на stderr (stdout занят результатами работы)
+    """
+    c_handler.setStream(sys.stderr)
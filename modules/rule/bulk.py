@@ -0,0 +1,146 @@
+import csv
+import itertools
+import json
+import sys
+import time
+
+from modules.log import logger
+from modules.rule.report import CSVLine
+from modules.rule.verdict import FLOW_COMMANDS, check_flow
+
+# Столбцы CSV с результатами проверки потоков (одна строка на поток и pfSense)
+CSV_RESULT_HEADER = ['src', 'dst', 'proto', 'port', 'sport', 'in', 'router', 'ingress', 'verdict', 'default',
+                     'tracker', 'description', 'indeterminate', 'unknown_ingress', 'error']
+
+
+def get_format(path, default):
+    """
+    Формат файла потоков по расширению (csv или jsonl).
+    """
+    if path.lower().endswith(('.jsonl', '.json', '.ndjson')):
+        return 'jsonl'
+    if path.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_flows(file, flows_format=None):
+    """
+    Построчно читает потоки из CSV (с заголовком, разделитель ',' или ';') или JSONL.
+
+    Args:
+        file (file): Открытый файл (или stdin).
+        flows_format (str, optional): Формат (csv или jsonl), по умолчанию - по первой строке.
+
+    Yields:
+        dict: Поля потока; для неразобранной строки - {'error': описание}.
+    """
+    header = file.readline()
+    while header and not header.strip():
+        header = file.readline()
+    if flows_format is None:
+        flows_format = 'jsonl' if header.lstrip().startswith('{') else 'csv'
+
+    if flows_format == 'jsonl':
+        for num, line in enumerate(itertools.chain([header], file), 1):
+            if not line.strip():
+                continue
+            try:
+                fields = json.loads(line)
+            except ValueError:
+                yield {'error': f'Invalid JSON in line {num}'}
+                continue
+            yield fields if isinstance(fields, dict) else {'error': f'Expected object in line {num}'}
+        return
+
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    columns = [column.strip().lower() for column in next(csv.reader([header], delimiter=delimiter), [])]
+    for row in csv.reader(file, delimiter=delimiter):
+        if not any(row):
+            continue
+        yield {column: value.strip() for column, value in zip(columns, row) if column in FLOW_COMMANDS}
+
+
+def check_flows(inp_pfs, flows, progress_every=5.0):
+    """
+    Проверяет потоки на всех pfSense, периодически сообщая о ходе проверки и скорости.
+
+    Args:
+        inp_pfs (tuple): Снимок pfSense.
+        flows (iterable): Поля потоков (read_flows).
+        progress_every (float): Интервал сообщений о ходе проверки (в секундах).
+
+    Yields:
+        dict: Результат проверки потока (check_flow).
+    """
+    start = last_report = time.monotonic()
+    count = 0
+    for flow_fields in flows:
+        if 'error' in flow_fields:
+            yield {'flow': {}, 'rows': [], 'unknown_ingress': [], 'error': flow_fields['error']}
+        else:
+            yield check_flow(inp_pfs, flow_fields)
+        count += 1
+
+        now = time.monotonic()
+        if now - last_report >= progress_every:
+            last_report = now
+            logger.info(f"Flows checked: {count} ({count / (now - start):.0f} flows/s)")
+
+    elapsed = time.monotonic() - start
+    logger.info(f"Flows checked: {count} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} flows/s)")
+
+
+def iter_jsonl(results):
+    """
+    Результаты проверки потоков в формате JSONL (одна строка на поток).
+    """
+    for result in results:
+        yield json.dumps(result, ensure_ascii=False) + '\n'
+
+
+def iter_csv(results):
+    """
+    Результаты проверки потоков в формате CSV (одна строка на поток и pfSense).
+    """
+    writer = csv.writer(CSVLine())
+    yield writer.writerow(CSV_RESULT_HEADER)
+    for result in results:
+        flow = [result['flow'].get(key, '') for key in ('src', 'dst', 'proto', 'port', 'sport', 'in')]
+        unknown_ingress = ','.join(result['unknown_ingress'])
+        if not result['rows']:
+            yield writer.writerow(flow + ['', '', '', '', '', '', '', unknown_ingress, result['error'] or ''])
+        for row in result['rows']:
+            rule = row['rule'] or {}
+            indeterminate = ','.join(item['tracker'] for item in row['indeterminate'])
+            yield writer.writerow(flow + [row['pf'], row['ingress'], row['verdict'], row['default'],
+                                          rule.get('tracker', ''), rule.get('description', ''), indeterminate,
+                                          unknown_ingress, ''])
+
+
+def run_flows(inp_pfs, input_path, output_path='-', input_format=None, output_format=None):
+    """
+    Проверяет потоки из файла (или stdin) и потоково записывает результаты в файл (или stdout).
+
+    Args:
+        inp_pfs (tuple): Снимок pfSense.
+        input_path (str): Файл потоков ('-' - stdin).
+        output_path (str): Файл результатов ('-' - stdout).
+        input_format (str, optional): Формат потоков (csv или jsonl), по умолчанию - по расширению файла
+                                      или содержимому.
+        output_format (str, optional): Формат результатов (csv или jsonl), по умолчанию - по расширению файла.
+    """
+    input_file = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8-sig', newline='')
+    output_file = sys.stdout if output_path == '-' else open(output_path, 'w', encoding='UTF-8', newline='')
+    input_format = input_format or get_format(input_path, None)
+    output_format = output_format or get_format(output_path, 'jsonl')
+    try:
+        results = check_flows(inp_pfs, read_flows(input_file, input_format))
+        for chunk in (iter_csv(results) if output_format == 'csv' else iter_jsonl(results)):
+            output_file.write(chunk)
+        output_file.flush()
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
@@ -1,123 +1,257 @@
-from modules.rule.format import format_rule
-from modules.service.pfsense import RulePFSense, PFSense
-from prettytable import PrettyTable
+from modules.service.pfsense import IPQuery, RulePFSense, PFSense, parse_port_range
 
 
-def check_field_match(field, query_field):
+def compile_field_match(query_field):
     """
-    Проверяет совпадение поля с запросом.
+    Компилирует проверку строкового поля по запросу.
 
     Args:
-        field (str): Поле для проверки.
         query_field (dict): Запрос для поля.
 
     Returns:
-        bool: True, если найдено совпадение, в противном случае False.
+        callable | None: Функция проверки значения поля или None, если проверка не требуется.
     """
     if not query_field:
-        return True
+        return None
 
     value = query_field['value'].lower()
-    field_lower = field.lower()
 
-    methods = {
-        '+': value in field_lower,
-        '=': value == field_lower,
-        '!': value != field_lower
-    }
-    return methods.get(query_field['method'], True)
+    match query_field['method']:
+        case '+':
+            return lambda field: value in field.lower()
+        case '=':
+            return lambda field: value == field.lower()
+        case '!':
+            return lambda field: value != field.lower()
+    return None
+
+
+class DirectionQuery:
+    """
+    Скомпилированная проверка направления (source/destination) по запросу.
+    """
+
+    def __init__(self, query_field):
+        self.value = query_field['value']
+        self.method = query_field['method']
+        # Правила с any учитываются для не домашних pf только при поиске 0.0.0.0
+        self.any_allowed = '0.0.0.0' in self.value
+        # IP из запроса разбирается один раз
+        self.ip_query = IPQuery(self.value)
+
+    def check(self, inp_direction, home=True):
+        """
+        Проверяет совпадение направления одного правила с запросом.
+
+        Args:
+            inp_direction (dict): Список объектов направления.
+            home (bool, optional): Флаг домашней сети. Defaults to True.
+
+        Returns:
+            bool: True, если найдено совпадение, в противном случае False.
+        """
+        any_included = home or self.any_allowed
+        ip_query = self.ip_query
+        direction = inp_direction['direction']
+
+        match self.method:
+            case '+':
+                found = any((any_included or not item.is_any) and item.ip_in_range(ip_query) for item in direction)
+            case '=':
+                found = any((any_included or not item.is_any) and item.ip_exact_match(ip_query) for item in direction)
+            case '!':
+                found = not any((any_included or not item.is_any) and item.ip_in_range(ip_query) for item in direction)
+            case _:
+                return True
 
+        if inp_direction['inverse'] and self.method != '=':
+            found = not found
+        return found
 
-def check_direction_match(inp_direction, query_field, home=True):
+    def candidates(self, index, home=True):
+        """
+        Находит по индексу адресов правила pfSense, подходящие под запрос.
+
+        Args:
+            index (AddressIndex): Индекс адресов направления.
+            home (bool, optional): Флаг домашней сети. Defaults to True.
+
+        Returns:
+            set | None: Идентификаторы подходящих правил или None, если проверка не ограничивает поиск.
+        """
+        return index.match(self.method, self.ip_query, home or self.any_allowed)
+
+
+def compile_direction_match(query_field):
     """
-    Проверяет совпадение направления с запросом.
+    Компилирует проверку направления (source/destination) по запросу.
 
     Args:
-        inp_direction (dict): Список объектов направления.
         query_field (dict): Запрос для направления.
-        home (bool, optional): Флаг домашней сети. Defaults to True.
 
     Returns:
-        bool: True, если найдено совпадение, в противном случае False.
+        DirectionQuery | None: Проверка направления или None, если проверка не требуется.
     """
+    if not query_field or query_field['method'] not in ('+', '=', '!'):
+        return None
+    return DirectionQuery(query_field)
 
-    def flag_search(item, inp_home, inp_value):
-        return inp_home or str(item) != '0.0.0.0/0' or '0.0.0.0' in inp_value
 
-    if not query_field:
+class PortQuery:
+    """
+    Скомпилированная проверка портов назначения по запросу.
+
+    Порт или диапазон портов из запроса сравнивается с числовыми диапазонами портов правила:
+    '+' - диапазон правила содержит запрос (правила без портов подходят всегда),
+    '=' - диапазон правила совпадает с запросом, '!' - совпадающего диапазона нет.
+    Запрос, не являющийся портом, сравнивается со строками портов правила.
+    """
+
+    def __init__(self, query_field):
+        self.value = query_field['value']
+        self.method = query_field['method']
+        # Диапазон портов из запроса разбирается один раз
+        self.port_range = parse_port_range(self.value)
+
+    def check(self, inp_rule):
+        """
+        Проверяет совпадение портов назначения одного правила с запросом.
+
+        Args:
+            inp_rule (RulePFSense): Правило с заполненными destination_ports и port_ranges.
+
+        Returns:
+            bool: True, если найдено совпадение, в противном случае False.
+        """
+        port_range = self.port_range
+        if port_range is None:
+            match self.method:
+                case '+':
+                    return not inp_rule.destination_ports or any(
+                        self.value in port for port in inp_rule.destination_ports)
+                case '=':
+                    return self.value in inp_rule.destination_ports
+                case '!':
+                    return self.value not in inp_rule.destination_ports
+            return True
+
+        first, last = port_range
+        match self.method:
+            case '+':
+                return not inp_rule.destination_ports or any(
+                    range_first <= first and last <= range_last for range_first, range_last in inp_rule.port_ranges)
+            case '=':
+                return port_range in inp_rule.port_ranges
+            case '!':
+                return port_range not in inp_rule.port_ranges
         return True
 
-    value = query_field['value']
-    direction = inp_direction['direction']
-    methods = {
-        '+': any(flag_search(item, home, value) and item.ip_in_range(value) for item in direction),
-        '=': any(flag_search(item, home, value) and item.ip_exact_match(value) for item in direction),
-        '!': all(not (flag_search(item, home, value) and item.ip_in_range(value)) for item in direction)
-    }
-    found = methods.get(query_field['method'], True)
-    if inp_direction['inverse'] and query_field['method'] != '=':
-        found = not found
-    return found
+    def candidates(self, index):
+        """
+        Находит по индексу портов правила pfSense, подходящие под запрос.
+
+        Args:
+            index (PortIndex): Индекс портов назначения.
+
+        Returns:
+            set | None: Идентификаторы подходящих правил или None, если запрос не является портом.
+        """
+        if self.port_range is None:
+            return None
+        return index.match(self.method, self.port_range)
 
 
-def check_port_match(destination_ports, port_query):
+def compile_port_match(port_query):
     """
-    Проверяет совпадение порта с запросом.
+    Компилирует проверку портов по запросу.
 
     Args:
-        destination_ports (list): Список целевых портов.
         port_query (dict): Запрос для порта.
 
     Returns:
-        bool: True, если найдено совпадение, в противном случае False.
+        PortQuery | None: Проверка портов или None, если проверка не требуется.
     """
-    if not port_query:
-        return True
-    value = port_query['value']
-    methods = {
-        '+': any(value in port for port in destination_ports),
-        '=': value in destination_ports,
-        '!': value not in destination_ports
-    }
-    return methods.get(port_query['method'], True)
+    if not port_query or port_query['method'] not in ('+', '=', '!'):
+        return None
+    return PortQuery(port_query)
 
 
-def check_rule_match(inp_rule, inp_query, inp_num, inp_pf, inp_table, home):
+class CompiledQuery:
     """
-    Проверяет соответствие правила запросу и добавляет его в таблицу, если найдено совпадение.
-
-    Args:
-        inp_rule (RulePFSense): Проверяемое правило.
-        inp_query (dict): Запрос для правила.
-        inp_num (int): Номер входного правила.
-        inp_pf (PFSense): Объект PFSense.
-        inp_table (PrettyTable): Таблица для добавления совпадающих правил.
-        home (bool): Флаг домашней сети.
+    Запрос, один раз скомпилированный в цепочку проверок.
 
-    Returns:
-        bool: True, если найдено совпадение, в противном случае False.
+    Проверки выполняются до первого несовпадения: сначала дешёвые строковые
+    (pf, action, description), затем проверки портов и IP-адресов.
+    Порты и IP-адреса при поиске по pfSense проверяются по индексам (candidates).
     """
-    # Пропуск отключённых правил
-    if inp_rule.disabled != 'no':
-        return False
-
-    # Проверка pf
-    found_pf = check_field_match(inp_pf.name, inp_query['pf'])
-    # Проверка action
-    found_act = check_field_match(inp_rule.type, inp_query['act'])
-    # Проверка description
-    found_desc = check_field_match(inp_rule.descr, inp_query['desc'])
-    # Проверка source
-    found_src = check_direction_match(inp_rule.source_obj, inp_query['src'], home)
-    # Проверка destination
-    found_dst = check_direction_match(inp_rule.destination_obj, inp_query['dst'])
-    # Проверка port
-    found_port = check_port_match(inp_rule.destination_ports, inp_query['port'])
-
-    find_rule = all([found_pf, found_act, found_desc, found_src, found_dst, found_port])
-
-    # Если правило подошло под критерии - заносим его в таблицу
-    if find_rule:
-        inp_table.add_row(format_rule(inp_pf, inp_rule, inp_num))
-
-    return find_rule
+
+    def __init__(self, inp_query):
+        self.query = inp_query
+
+        self.check_pf = compile_field_match(inp_query['pf'])
+        check_act = compile_field_match(inp_query['act'])
+        check_desc = compile_field_match(inp_query['desc'])
+        self.port = compile_port_match(inp_query['port'])
+        self.dst = compile_direction_match(inp_query['dst'])
+        self.src = compile_direction_match(inp_query['src'])
+
+        checks = []
+        if check_act:
+            checks.append(lambda rule: check_act(rule.type))
+        if check_desc:
+            checks.append(lambda rule: check_desc(rule.descr))
+        # Порт, не являющийся числом, не ищется по индексу и проверяется вместе со строковыми полями
+        if self.port and self.port.port_range is None:
+            checks.append(self.port.check)
+        self.checks = tuple(checks)
+
+    def match_pf(self, inp_pf):
+        """
+        Проверяет, подходит ли pfSense под запрос (по имени).
+        """
+        return self.check_pf is None or self.check_pf(inp_pf.name)
+
+    def match_fields(self, inp_rule):
+        """
+        Проверяет правило по условиям запроса, не связанным с IP-адресами.
+        """
+        for check in self.checks:
+            if not check(inp_rule):
+                return False
+        return True
+
+    def match_rule(self, inp_rule, home=True):
+        """
+        Проверяет правило по всем условиям запроса, кроме имени pfSense.
+        """
+        if not self.match_fields(inp_rule):
+            return False
+        if self.port and self.port.port_range is not None and not self.port.check(inp_rule):
+            return False
+        if self.dst and not self.dst.check(inp_rule.destination_obj):
+            return False
+        if self.src and not self.src.check(inp_rule.source_obj, home):
+            return False
+        return True
+
+    def candidates(self, inp_config, home=True):
+        """
+        Находит по индексам портов и адресов правила pfSense, подходящие под условия port/source/destination.
+
+        Args:
+            inp_config (RulesPFSense): Конфигурация pfSense.
+            home (bool): Флаг домашней сети.
+
+        Returns:
+            set | None: Идентификаторы правил или None, если в запросе нет условий по портам и IP-адресам.
+        """
+        found = None
+        if self.port:
+            found = self.port.candidates(inp_config.port_index)
+        if self.dst and found != set():
+            dst_found = self.dst.candidates(inp_config.destination_index)
+            found = dst_found if found is None else found & dst_found
+        if self.src and found != set():
+            src_found = self.src.candidates(inp_config.source_index, home)
+            found = src_found if found is None else found & src_found
+        return found
@@ -0,0 +1,104 @@
+import datetime
+import re
+import time
+
+from modules.log import logger
+from modules.rule.check import compile_field_match
+
+# Относительное время: 30m, 12h, 7d, 2w
+SINCE_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_since(value, now=None):
+    """
+    Разбирает время начала сравнения: относительное (30m, 12h, 7d, 2w)
+    или дату/время в формате ISO (2024-05-01, 2024-05-01T12:00).
+
+    Args:
+        value (str): Значение из запроса.
+        now (float, optional): Текущее время (timestamp).
+
+    Returns:
+        float | None: Время (timestamp) или None, если значение не разобрано.
+    """
+    match = re.fullmatch(r'(\d+)([mhdw])', value)
+    if match:
+        return (time.time() if now is None else now) - int(match.group(1)) * SINCE_UNITS[match.group(2)]
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def diff_rules(old_config, new_config):
+    """
+    Сравнивает правила двух версий конфигурации по хешам полей (за один проход по правилам).
+
+    Args:
+        old_config (RulesPFSense): Прежняя версия.
+        new_config (RulesPFSense): Текущая версия.
+
+    Returns:
+        list: Изменения (состояние, прежнее правило, текущее правило), где состояние - add, del или chg:
+              добавленные и изменённые - в порядке текущей конфигурации, затем удалённые.
+    """
+    old, new = old_config.fingerprint, new_config.fingerprint
+    changes = []
+    for key, (digest, rule_id) in new.items():
+        previous = old.get(key)
+        if previous is None:
+            changes.append(('add', None, new_config.filter[rule_id]))
+        elif previous[0] != digest:
+            changes.append(('chg', old_config.filter[previous[1]], new_config.filter[rule_id]))
+    for key, (digest, rule_id) in old.items():
+        if key not in new:
+            changes.append(('del', old_config.filter[rule_id], None))
+    return changes
+
+
+def diff_pf(inp_pf, since):
+    """
+    Находит изменения правил pfSense с момента since.
+
+    Args:
+        inp_pf (PFSense): Объект PFSense.
+        since (float): Время начала сравнения (timestamp).
+
+    Returns:
+        tuple | None: (время снимка, с которым выполнено сравнение, модель правил снимка, изменения)
+                      или None, если история снимков недоступна.
+    """
+    snapshot = inp_pf.get_snapshot(since)
+    if snapshot is None:
+        return None
+    snapshot_time, config_hash = snapshot
+    if config_hash == inp_pf.config_hash:
+        return snapshot_time, inp_pf.config, []
+
+    try:
+        old_config = inp_pf.load_snapshot(config_hash)
+    except OSError as e:
+        logger.warning(f"[{inp_pf.name}] Config snapshot {config_hash} is not available: {e}")
+        return None
+    return snapshot_time, old_config, diff_rules(old_config, inp_pf.config)
+
+
+def diff_pfs(inp_pfs, since, pf_query=None):
+    """
+    Находит изменения правил на всех pfSense с момента since.
+
+    Args:
+        inp_pfs (tuple): Снимок pfSense.
+        since (float): Время начала сравнения (timestamp).
+        pf_query (dict, optional): Условие на имя pfSense из запроса.
+
+    Yields:
+        tuple: (PFSense, время снимка, модель правил снимка, изменения) для pfSense с историей снимков.
+    """
+    check_pf = compile_field_match(pf_query)
+    for pf in inp_pfs:
+        if check_pf is not None and not check_pf(pf.name):
+            continue
+        diff = diff_pf(pf, since)
+        if diff is not None:
+            yield pf, *diff
@@ -0,0 +1,186 @@
+import multiprocessing
+import threading
+
+from modules.log import logger
+from modules.rule.check import CompiledQuery
+from modules.rule.search import search_pfs
+from modules.service.pfsense import PFSense
+
+
+def _worker(conn):
+    """
+    Рабочий процесс: хранит свою часть моделей правил pfSense и выполняет по ним поиск.
+
+    Команды (кортеж (команда, данные)):
+        load   - (список IP в порядке поиска,
+                  {IP: (имя, модель правил, сети из NetBox)} новых и изменившихся pfSense)
+        search - разобранный поисковый запрос; ответ - номера найденных правил по каждому pfSense
+        stop   - завершение процесса
+    """
+    pfs = {}
+    # pfSense в порядке поиска (один кортеж на снимок - индексы снимка строятся один раз)
+    shard = ()
+    while True:
+        try:
+            command, data = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            match command:
+                case 'load':
+                    order, updates = data
+                    for ip, (name, config, networks) in updates.items():
+                        pf = PFSense(name=name, ip=ip)
+                        pf.config = config
+                        pf.networks = networks
+                        pfs[ip] = pf
+                    pfs = {ip: pfs[ip] for ip in order}
+                    shard = tuple(pfs[ip] for ip in order)
+                    conn.send(('ok', None))
+                case 'search':
+                    compiled_query = CompiledQuery(data)
+                    conn.send(('ok', [
+                        [rule.rule_id for rule in rules]
+                        for pf, rules in search_pfs(shard, compiled_query)
+                    ]))
+                case 'stop':
+                    break
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+    conn.close()
+
+
+class QueryExecutor:
+    """
+    Параллельный поиск правил: pfSense распределяются между рабочими процессами,
+    каждый из которых хранит собственную копию моделей правил своих pfSense.
+
+    Процессы возвращают только номера найденных правил, а результаты собираются
+    по моделям основного процесса в исходном порядке pfSense.
+    """
+
+    def __init__(self, workers):
+        """
+        Args:
+            workers (int): Количество рабочих процессов.
+        """
+        self.workers = workers
+        self.__lock = threading.Lock()
+        self.__processes = []
+        self.__conns = []
+        # Снимок pfSense, загруженный в рабочие процессы
+        self.__pfs = None
+        # IP -> номер рабочего процесса
+        self.__assignment = {}
+        # Модели, переданные рабочим процессам: [{IP: (модель правил, сети из NetBox)}]
+        self.__sent = []
+        self.__broken = False
+
+    def start(self):
+        """
+        Запускает рабочие процессы.
+        """
+        context = multiprocessing.get_context('spawn')
+        for num in range(self.workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker, args=(child_conn,), name=f'query-worker-{num}', daemon=True)
+            process.start()
+            child_conn.close()
+            self.__processes.append(process)
+            self.__conns.append(parent_conn)
+            self.__sent.append({})
+        logger.info(f"Query executor started ({self.workers} processes)")
+
+    def stop(self):
+        """
+        Останавливает рабочие процессы.
+        """
+        with self.__lock:
+            for conn in self.__conns:
+                try:
+                    conn.send(('stop', None))
+                    conn.close()
+                except OSError:
+                    pass
+            for process in self.__processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            self.__processes = []
+            self.__conns = []
+            self.__sent = []
+            self.__pfs = None
+
+    def search(self, inp_pfs, parsed_query):
+        """
+        Ищет правила, подходящие под запрос, на всех pfSense.
+
+        Args:
+            inp_pfs (tuple): Снимок pfSense.
+            parsed_query (dict): Разобранный поисковый запрос.
+
+        Returns:
+            list: Пары (PFSense, список подходящих правил) в исходном порядке pfSense.
+        """
+        if self.__broken or not self.__processes:
+            return list(search_pfs(inp_pfs, CompiledQuery(parsed_query)))
+
+        try:
+            with self.__lock:
+                if inp_pfs is not self.__pfs:
+                    self.__load(inp_pfs)
+                return self.__search(inp_pfs, parsed_query)
+        except Exception as e:
+            # Рабочие процессы недоступны - дальнейший поиск выполняется в основном процессе
+            logger.exception(f"Query executor failed, falling back to serial search: {e}")
+            self.__broken = True
+            return list(search_pfs(inp_pfs, CompiledQuery(parsed_query)))
+
+    def __load(self, inp_pfs):
+        # Новые pfSense назначаются наименее загруженному процессу (по количеству правил)
+        load = [0] * self.workers
+        for pf in inp_pfs:
+            if pf.ip in self.__assignment:
+                load[self.__assignment[pf.ip]] += len(pf.config.filter)
+        for pf in inp_pfs:
+            if pf.ip not in self.__assignment:
+                worker = load.index(min(load))
+                self.__assignment[pf.ip] = worker
+                load[worker] += len(pf.config.filter)
+
+        # Процессам передаются только новые и изменившиеся модели
+        for worker, conn in enumerate(self.__conns):
+            order = [pf.ip for pf in inp_pfs if self.__assignment[pf.ip] == worker]
+            updates = {
+                pf.ip: (pf.name, pf.config, pf.networks)
+                for pf in inp_pfs
+                if self.__assignment[pf.ip] == worker and not self.__is_sent(worker, pf)
+            }
+            conn.send(('load', (order, updates)))
+        for worker, conn in enumerate(self.__conns):
+            self.__receive(conn)
+            self.__sent[worker] = {pf.ip: (pf.config, pf.networks) for pf in inp_pfs
+                                   if self.__assignment[pf.ip] == worker}
+        self.__pfs = inp_pfs
+
+    def __search(self, inp_pfs, parsed_query):
+        for conn in self.__conns:
+            conn.send(('search', parsed_query))
+
+        found = {}
+        for worker, conn in enumerate(self.__conns):
+            order = [pf.ip for pf in inp_pfs if self.__assignment[pf.ip] == worker]
+            found.update(zip(order, self.__receive(conn)))
+
+        return [(pf, [pf.config.filter[rule_id] for rule_id in found[pf.ip]]) for pf in inp_pfs]
+
+    def __is_sent(self, worker, pf):
+        sent = self.__sent[worker].get(pf.ip)
+        return sent is not None and sent[0] is pf.config and sent[1] is pf.networks
+
+    @staticmethod
+    def __receive(conn):
+        status, data = conn.recv()
+        if status != 'ok':
+            raise RuntimeError(data)
+        return data
@@ -1,5 +1,10 @@
+import datetime
+
 from colorama import Fore
 
+# Названия изменений правил для вывода
+CHANGE_NAMES = {'add': 'ADDED', 'del': 'DELETED', 'chg_old': 'CHANGED (old)', 'chg_new': 'CHANGED (new)'}
+
 
 def format_rule_direction(obj, csv=False):
     if csv:
@@ -10,14 +15,14 @@ def format_rule_direction(obj, csv=False):
     )
 
 
-def format_rule_interfaces(pf, interfaces, csv=False):
+def format_rule_interfaces(config, interfaces, csv=False):
     interface_list = interfaces.split(',')
     if csv:
         return ','.join(
-            [pf.config.interfaces[i].descr if pf.config.interfaces[i] else i for i in interface_list]
+            [config.interfaces[i].descr if config.interfaces[i] else i for i in interface_list]
         )
     return '\n'.join(
-        [pf.config.interfaces[i].descr if pf.config.interfaces[i] else i for i in interface_list]
+        [config.interfaces[i].descr if config.interfaces[i] else i for i in interface_list]
     )
 
 
@@ -34,14 +39,15 @@ def format_rule_type(rule_type, csv=False):
             return rule_type
 
 
-def format_rule(inp_pf, inp_rule, inp_num, csv=False):
+def format_rule(inp_pf, inp_rule, inp_num, csv=False, inp_config=None):
     str_source = format_rule_direction(inp_rule.source_obj, csv)
     str_destination = format_rule_direction(inp_rule.destination_obj, csv)
     if csv:
         str_ports = ','.join(inp_rule.destination_ports)
     else:
         str_ports = '\n'.join(inp_rule.destination_ports)
-    str_interface = format_rule_interfaces(inp_pf, inp_rule.interface, csv)
+    # Правило из снимка конфигурации выводится с интерфейсами этого снимка
+    str_interface = format_rule_interfaces(inp_config or inp_pf.config, inp_rule.interface, csv)
     str_type = format_rule_type(inp_rule.type, csv)
 
     return [inp_pf.name,
@@ -56,3 +62,143 @@ def format_rule(inp_pf, inp_rule, inp_num, csv=False):
             str_ports,
             inp_rule.gateway_full,
             inp_rule.descr_full]
+
+
+def format_rule_dict(inp_pf, inp_rule, inp_num, inp_config=None):
+    """
+    Формирует структурированное (без форматирования для вывода) представление правила.
+
+    Args:
+        inp_pf (PFSense): Объект PFSense.
+        inp_rule (RulePFSense): Правило.
+        inp_num (int): Номер правила в результатах поиска по pfSense.
+        inp_config (RulesPFSense, optional): Модель правил, к которой относится правило (по умолчанию - текущая).
+
+    Returns:
+        dict: Поля правила.
+    """
+    interfaces = (inp_config or inp_pf.config).interfaces
+
+    def direction(obj):
+        return {'inverse': obj['inverse'], 'direction': [str(j) for j in obj['direction']]}
+
+    return {'pf': inp_pf.name,
+            'num': inp_num + 1,
+            'tracker': inp_rule.tracker,
+            'action': inp_rule.type,
+            'floating': inp_rule.floating_full,
+            'protocol': inp_rule.protocol_full,
+            'interface': [interfaces[i].descr if interfaces[i] else i for i in inp_rule.interface.split(',')],
+            'source': direction(inp_rule.source_obj),
+            'destination': direction(inp_rule.destination_obj),
+            'ports': list(inp_rule.destination_ports),
+            'gateway': inp_rule.gateway_full,
+            'description': inp_rule.descr_full}
+
+
+def format_owner_dict(inp_pf, inp_interface):
+    """
+    Формирует представление интерфейса pfSense, которому принадлежит IP.
+
+    Args:
+        inp_pf (PFSense): Объект PFSense.
+        inp_interface (InterfacePFSense): Интерфейс pfSense.
+
+    Returns:
+        dict: pfSense, описание и сеть интерфейса.
+    """
+    return {'pf': inp_pf.name,
+            'interface': inp_interface.descr or inp_interface.interface,
+            'network': inp_interface.get_ip_obj()}
+
+
+def format_verdict(inp_pf, inp_ingress, inp_rule, inp_indeterminate=(), csv=False):
+    """
+    Формирует строку таблицы с решающим правилом pfSense для потока.
+
+    Args:
+        inp_pf (PFSense): Объект PFSense.
+        inp_ingress (str): Входящий интерфейс.
+        inp_rule (RulePFSense | None): Решающее правило (None - блокировка по умолчанию).
+        inp_indeterminate (list): Правила, применимость которых к потоку не определена.
+        csv (bool): Формат CSV.
+
+    Returns:
+        list: PF Name, Ingress, Verdict, Tracker, Floating, Interface, Source, Destination, Ports, Description,
+              Indeterminate.
+    """
+    str_ingress = format_rule_interfaces(inp_pf.config, inp_ingress, csv)
+    str_indeterminate = (',' if csv else '\n').join(rule.tracker for rule in inp_indeterminate)
+    if inp_rule is None:
+        return [inp_pf.name, str_ingress, format_rule_type('block', csv) + ' (default)', '', '', '', '', '', '', '',
+                str_indeterminate]
+
+    row = format_rule(inp_pf, inp_rule, inp_pf.config.order[inp_rule.rule_id], csv)
+    return [inp_pf.name, str_ingress, row[3], row[2], row[4], row[6], row[7], row[8], row[9], row[11],
+            str_indeterminate]
+
+
+def format_verdict_dict(inp_pf, inp_ingress, inp_rule, inp_indeterminate=()):
+    """
+    Формирует структурированное представление решения pfSense по потоку.
+
+    Returns:
+        dict: pfSense, входящий интерфейс, решение, решающее правило (None - блокировка по умолчанию)
+              и правила, применимость которых к потоку не определена (indeterminate).
+    """
+    interface = inp_pf.config.interfaces[inp_ingress]
+    return {'pf': inp_pf.name,
+            'ingress': interface.descr if interface else inp_ingress,
+            'verdict': inp_rule.type if inp_rule else 'block',
+            'default': inp_rule is None,
+            'rule': format_rule_dict(inp_pf, inp_rule, inp_pf.config.order[inp_rule.rule_id]) if inp_rule else None,
+            'indeterminate': [format_rule_dict(inp_pf, rule, inp_pf.config.order[rule.rule_id])
+                              for rule in inp_indeterminate]}
+
+
+def format_change(inp_pf, inp_config, inp_state, inp_rule, csv=False):
+    """
+    Формирует строку таблицы изменений правил pfSense.
+
+    Args:
+        inp_pf (PFSense): Объект PFSense.
+        inp_config (RulesPFSense): Модель правил, к которой относится правило (снимок для del и chg_old).
+        inp_state (str): Изменение: add, del, chg_old (прежняя версия) или chg_new (текущая версия).
+        inp_rule (RulePFSense): Правило.
+        csv (bool): Формат CSV.
+
+    Returns:
+        list: PF Name, Change, Tracker, Action, Floating, Interface, Source, Destination, Ports, Description.
+    """
+    str_change = CHANGE_NAMES[inp_state]
+    if not csv:
+        color = {'add': Fore.GREEN, 'del': Fore.RED}.get(inp_state, Fore.YELLOW)
+        str_change = f"{color}{str_change}{Fore.RESET}"
+
+    row = format_rule(inp_pf, inp_rule, inp_rule.rule_id, csv, inp_config)
+    return [inp_pf.name, str_change, row[2], row[3], row[4], row[6], row[7], row[8], row[9], row[11]]
+
+
+def format_change_dict(inp_pf, inp_snapshot_time, inp_old_config, inp_state, inp_old_rule, inp_new_rule):
+    """
+    Формирует структурированное представление изменения правила pfSense.
+
+    Args:
+        inp_pf (PFSense): Объект PFSense.
+        inp_snapshot_time (float): Время снимка, с которым выполнено сравнение.
+        inp_old_config (RulesPFSense): Модель правил снимка (для прежней версии правила).
+        inp_state (str): Изменение: add, del или chg.
+        inp_old_rule (RulePFSense | None): Прежняя версия правила.
+        inp_new_rule (RulePFSense | None): Текущая версия правила.
+
+    Returns:
+        dict: pfSense, время снимка, изменение, tracker и обе версии правила.
+    """
+    rule = inp_new_rule or inp_old_rule
+    return {'pf': inp_pf.name,
+            'snapshot': datetime.datetime.fromtimestamp(inp_snapshot_time).isoformat(timespec='seconds'),
+            'state': inp_state,
+            'tracker': rule.tracker,
+            'old': (format_rule_dict(inp_pf, inp_old_rule, inp_old_rule.rule_id, inp_old_config)
+                    if inp_old_rule else None),
+            'new': format_rule_dict(inp_pf, inp_new_rule, inp_new_rule.rule_id) if inp_new_rule else None}
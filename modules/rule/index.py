@@ -0,0 +1,285 @@
+from bisect import bisect_right
+
+
+class AddressIndex:
+    """
+    Индекс адресов одного направления (source/destination) всех правил pfSense.
+
+    Сети правил (NetPoint) - это CIDR-блоки, поэтому блоки, содержащие искомый адрес,
+    находятся маскированием адреса под каждый из встречающихся размеров блока.
+    Правила с any (0.0.0.0/0) хранятся отдельно, так как для не домашних pfSense
+    они учитываются только при поиске 0.0.0.0.
+    """
+
+    def __init__(self, rules, path):
+        """
+        Args:
+            rules (list): Правила (RulePFSense) с заполненными rule_id и *_obj.
+            path (str): Имя атрибута направления ('source_obj' или 'destination_obj').
+        """
+        self.rule_ids = set()
+        self.inverse_rules = set()
+        self.any_rules = set()
+        self.any_point = None
+        # (версия, размер блока) -> {первый адрес блока: {rule_id}}
+        self.networks = {}
+        # (версия, первый адрес, последний адрес) -> {rule_id}
+        self.exact_networks = {}
+        # (версия, адрес) -> {rule_id}
+        self.exact_addresses = {}
+
+        for rule in rules:
+            rule_id = rule.rule_id
+            direction = getattr(rule, path)
+            self.rule_ids.add(rule_id)
+            if direction['inverse']:
+                self.inverse_rules.add(rule_id)
+
+            for point in direction['direction']:
+                # url и прочие не IP-объекты никогда не совпадают с IP
+                if point.version is None:
+                    continue
+                if point.is_any:
+                    self.any_rules.add(rule_id)
+                    self.any_point = point
+                    continue
+                size = point.last - point.first
+                self.networks.setdefault((point.version, size), {}).setdefault(point.first, set()).add(rule_id)
+                self.exact_networks.setdefault((point.version, point.first, point.last), set()).add(rule_id)
+                self.exact_addresses.setdefault((point.version, point.value), set()).add(rule_id)
+
+    def find(self, ip_query, exact=False, any_included=True):
+        """
+        Находит правила, у которых хотя бы один адрес направления совпадает с IP из запроса.
+
+        Args:
+            ip_query (IPQuery): IP из запроса.
+            exact (bool): Точное совпадение (как ip_exact_match) вместо вхождения (как ip_in_range).
+            any_included (bool): Учитывать ли адреса any (0.0.0.0/0).
+
+        Returns:
+            set: Идентификаторы найденных правил.
+        """
+        found = set()
+
+        if exact:
+            if ip_query.exact is None:
+                return found
+            version, first, last, value = ip_query.exact
+            if ip_query.exact_network:
+                found.update(self.exact_networks.get((version, first, last), ()))
+            else:
+                found.update(self.exact_addresses.get((version, value), ()))
+        else:
+            if ip_query.range is None:
+                return found
+            version, first, last, _ = ip_query.range
+            for (net_version, size), networks in self.networks.items():
+                if net_version != version or last - first > size:
+                    continue
+                # Первый адрес блока заданного размера, в который попадает IP
+                block = first & ~size
+                if last <= block + size:
+                    found.update(networks.get(block, ()))
+
+        if any_included and self.any_rules:
+            any_found = (self.any_point.ip_exact_match(ip_query) if exact
+                         else self.any_point.ip_in_range(ip_query))
+            if any_found:
+                found.update(self.any_rules)
+
+        return found
+
+    def match(self, method, ip_query, any_included=True):
+        """
+        Находит правила, направление которых подходит под запрос
+        (с учётом метода поиска и инверсии направления).
+
+        Args:
+            method (str): Метод поиска ('+', '=' или '!').
+            ip_query (IPQuery): IP из запроса.
+            any_included (bool): Учитывать ли адреса any (0.0.0.0/0).
+
+        Returns:
+            set | None: Идентификаторы подходящих правил или None, если метод не ограничивает поиск.
+        """
+        match method:
+            case '+':
+                return self.find(ip_query, False, any_included) ^ self.inverse_rules
+            case '=':
+                return self.find(ip_query, True, any_included)
+            case '!':
+                return self.rule_ids - (self.find(ip_query, False, any_included) ^ self.inverse_rules)
+        return None
+
+
+class PortIndex:
+    """
+    Индекс портов назначения всех правил pfSense.
+
+    Порты правил разбираются в числовые диапазоны: одиночные порты хранятся в словаре,
+    диапазоны - в списке, отсортированном по первому порту. Над списком строится дерево
+    максимумов последнего порта: диапазоны, начинающиеся не позже искомого порта, находятся
+    двоичным поиском, а поддеревья, в которых ни один диапазон не доходит до искомого порта,
+    пропускаются целиком. Правила без портов (any) хранятся отдельно.
+    """
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules (list): Правила (RulePFSense) с заполненными rule_id, destination_ports и port_ranges.
+        """
+        self.rule_ids = set()
+        self.any_rules = set()
+        # порт -> {rule_id}
+        self.ports = {}
+        # (первый порт, последний порт) -> {rule_id}
+        self.exact_ranges = {}
+        # [(первый порт, последний порт, rule_id)], отсортированные по первому порту
+        ranges = []
+
+        for rule in rules:
+            rule_id = rule.rule_id
+            self.rule_ids.add(rule_id)
+            if not rule.destination_ports:
+                self.any_rules.add(rule_id)
+                continue
+            for first, last in rule.port_ranges:
+                self.exact_ranges.setdefault((first, last), set()).add(rule_id)
+                if first == last:
+                    self.ports.setdefault(first, set()).add(rule_id)
+                else:
+                    ranges.append((first, last, rule_id))
+
+        ranges.sort()
+        self.ranges = ranges
+        self.range_firsts = [first for first, _, _ in ranges]
+        # Дерево максимумов последнего порта: листья (с позиции range_size) - диапазоны в порядке списка,
+        # узел i - максимум узлов 2i и 2i+1
+        self.range_size = 1
+        while self.range_size < len(ranges):
+            self.range_size *= 2
+        self.range_lasts = [-1] * (2 * self.range_size)
+        for position, (_, last, _) in enumerate(ranges):
+            self.range_lasts[self.range_size + position] = last
+        for node in range(self.range_size - 1, 0, -1):
+            self.range_lasts[node] = max(self.range_lasts[2 * node], self.range_lasts[2 * node + 1])
+
+    def find(self, port_range):
+        """
+        Находит правила, хотя бы один диапазон портов которых содержит диапазон из запроса.
+
+        Args:
+            port_range (tuple): Диапазон портов из запроса (первый порт, последний порт).
+
+        Returns:
+            set: Идентификаторы найденных правил (без правил с any).
+        """
+        first, last = port_range
+        found = set()
+        if first == last:
+            found.update(self.ports.get(first, ()))
+        # Содержать запрос могут только диапазоны, начинающиеся не позже его первого порта
+        # (позиции до end) и заканчивающиеся не раньше его последнего порта
+        end = bisect_right(self.range_firsts, first)
+        if not end:
+            return found
+        range_lasts = self.range_lasts
+        nodes = [(1, 0, self.range_size)]
+        while nodes:
+            node, node_start, node_end = nodes.pop()
+            if range_lasts[node] < last:
+                continue
+            if node >= self.range_size:
+                found.add(self.ranges[node_start][2])
+                continue
+            middle = (node_start + node_end) // 2
+            nodes.append((2 * node, node_start, middle))
+            if middle < end:
+                nodes.append((2 * node + 1, middle, node_end))
+        return found
+
+    def match(self, method, port_range):
+        """
+        Находит правила, порты которых подходят под запрос.
+
+        Args:
+            method (str): Метод поиска ('+', '=' или '!').
+            port_range (tuple): Диапазон портов из запроса (первый порт, последний порт).
+
+        Returns:
+            set | None: Идентификаторы подходящих правил или None, если метод не ограничивает поиск.
+        """
+        match method:
+            case '+':
+                return self.find(port_range) | self.any_rules
+            case '=':
+                return set(self.exact_ranges.get(port_range, ()))
+            case '!':
+                return self.rule_ids - self.exact_ranges.get(port_range, set())
+        return None
+
+
+class HomeIndex:
+    """
+    Индекс сетей интерфейсов всех pfSense (из конфигураций и NetBox): по IP находит pfSense
+    (и их интерфейсы), в сеть интерфейса которых входит IP, то есть домашние для этого IP pfSense.
+
+    Индекс строится один раз для снимка pfSense и используется всеми запросами к этому снимку.
+    """
+    # Последний построенный индекс: (снимок pfSense, индекс)
+    __last = (None, None)
+
+    def __init__(self, pfs):
+        """
+        Args:
+            pfs (tuple): Снимок pfSense с загруженными моделями правил.
+        """
+        self.pfs = pfs
+        # (версия, размер блока) -> {первый адрес сети: [(позиция pfSense, интерфейс)]}
+        self.networks = {}
+        for position, pf in enumerate(pfs):
+            for version, first, last, interface in pf.get_home_networks():
+                self.networks.setdefault((version, last - first), {}).setdefault(first, []).append(
+                    (position, interface))
+
+    @classmethod
+    def get(cls, pfs):
+        """
+        Возвращает индекс для снимка pfSense, строя его только при смене снимка.
+        """
+        last_pfs, index = cls.__last
+        if last_pfs is not pfs:
+            index = cls(pfs)
+            cls.__last = (pfs, index)
+        return index
+
+    def find(self, ip_query):
+        """
+        Находит интерфейсы pfSense, в сеть которых входит IP из запроса.
+
+        Args:
+            ip_query (IPQuery): IP из запроса.
+
+        Returns:
+            list: Пары (позиция pfSense в снимке, интерфейс) в порядке pfSense.
+        """
+        if ip_query.range is None:
+            return []
+        version, first, last, _ = ip_query.range
+
+        found = []
+        for (net_version, size), networks in self.networks.items():
+            if net_version != version or last - first > size:
+                continue
+            # Первый адрес сети заданного размера, в которую попадает IP
+            block = first & ~size
+            if last <= block + size:
+                found.extend(networks.get(block, ()))
+        return sorted(found, key=lambda item: item[0])
+
+    def homes(self, ip_query):
+        """
+        Позиции домашних pfSense для IP из запроса.
+        """
+        return {position for position, _ in self.find(ip_query)}
@@ -0,0 +1,294 @@
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.log import logger
+from modules.rule.format import format_rule
+
+# Заголовок CSV отчёта
+CSV_HEADER = ["PF Name", "Num", "Tracker", "Action", "Floating", "Protocol", "Interface", "Source", "Destination",
+              "Ports", "Gateway", "Description"]
+
+# Столбцы HTML отчёта: [заголовок, поле правила]
+HTML_FIELDS = [['tracker', 'tracker'], ['action', 'type'], ['floating', 'floating'], ['interface', 'interface'],
+               ['protocol', 'protocol'], ['source', 'source'], ['destination', 'destination'],
+               ['gateway', 'gateway'], ['description', 'descr'], ['created', 'created'], ['updated', 'updated']]
+
+# Начало HTML отчёта со встроенными стилями
+HTML_HEAD_MINIFY = '''<html><head>
+    <meta charset="utf-8">
+</head>
+<body>
+    <style>
+    table{width:100%;margin:0 auto;clear:both;border-collapse:separate;border-spacing:0;border:1px solid #ababab;
+    font-size:12px}
+    table thead td,table thead th{padding:10px;border-bottom:1px solid rgba(0,0,0,.3)}
+    tbody tr:first-child td{border-top:none}tbody td{border-top:1px solid rgba(0,0,0,.15)}td,th{border-style:solid;
+    text-align:center!important}
+    tr:hover{background:#ffeb0052!important}
+    .disabled{background:repeating-linear-gradient(45deg,transparent 0 5px,#00000014 0 10px);color:#a7a7a7}
+    .disabled:hover{background:repeating-linear-gradient(45deg,transparent 0 5px,#00000014 0 10px)!important;color:#000}
+    .not{color:red;font-weight:700}th{text-transform:capitalize;border-color:#00000026;border-width:0 1 1 0}
+    body{margin:0}table thead th{padding:4px}thead th{font-size:15px;background-color:#bdbdbd}
+    td{padding:0 0 0 3px!important;border-width:0 1px 0 0;border-right-color:#00000026}html{font-family:sans-serif}
+    .add{background-color:#00ff0820!important}.del{background-color:#ff000020!important}
+    .chg_old{background:repeating-linear-gradient(45deg,transparent 0 5px,#0089ff20 0 10px)!important}
+    .chg_new{background-color:#0089ff20!important}.add:hover{background-color:#00ff0850!important}
+    .del:hover{background-color:#ff000050!important}
+    .chg_old:hover{background:repeating-linear-gradient(45deg,transparent 0 5px,#0089ff50 0 10px)!important}
+    .chg_new:hover{background-color:#0089ff50!important}
+    </style>
+    <table id='main_tbl' class='display'> 
+'''
+
+# Начало HTML отчёта с подключаемыми DataTables
+HTML_HEAD_FULL = '''<html><head>
+    <meta charset="utf-8">
+    <link rel="stylesheet" type="text/css" href="DataTables/datatables.min.css"/>
+    <link rel="stylesheet" type="text/css" href="DataTables/main.css"/>
+    <script type="text/javascript" src="DataTables/jquery.min.js"></script>
+    <script type="text/javascript" src="DataTables/datatables.min.js"></script>
+</head>
+<body>
+    <table id='main_tbl' class='display'>
+'''
+
+
+def iter_html(results, minify=True):
+    """
+    Формирует HTML отчёт по частям (строка за строкой таблицы) без сборки всего документа в памяти.
+
+    Args:
+        results (iterable): Пары (PFSense, список правил), например результат search_pfs.
+        minify (bool): Отчёт со встроенными стилями (True) или с подключаемыми DataTables (False).
+
+    Yields:
+        str: Очередной фрагмент HTML документа.
+    """
+    return iter_html_rows(((pf.config, rule, rule.state) for pf, rules in results for rule in rules), minify)
+
+
+def iter_diff_html(diffs, minify=True):
+    """
+    Формирует HTML отчёт об изменениях правил: добавленные (add), удалённые (del)
+    и изменённые правила - прежняя (chg_old) и текущая (chg_new) версии.
+
+    Args:
+        diffs (iterable): Изменения по pfSense, например результат diff_pfs.
+        minify (bool): Отчёт со встроенными стилями (True) или с подключаемыми DataTables (False).
+
+    Yields:
+        str: Очередной фрагмент HTML документа.
+    """
+    def rows():
+        for pf, _, old_config, changes in diffs:
+            for state, old_rule, new_rule in changes:
+                match state:
+                    case 'add':
+                        yield pf.config, new_rule, 'add'
+                    case 'del':
+                        yield old_config, old_rule, 'del'
+                    case 'chg':
+                        yield old_config, old_rule, 'chg_old'
+                        yield pf.config, new_rule, 'chg_new'
+
+    return iter_html_rows(rows(), minify)
+
+
+def iter_html_rows(rows, minify=True):
+    """
+    Формирует HTML отчёт из строк таблицы.
+
+    Args:
+        rows (iterable): Тройки (модель правил pfSense, правило, класс строки).
+        minify (bool): Отчёт со встроенными стилями (True) или с подключаемыми DataTables (False).
+
+    Yields:
+        str: Очередной фрагмент HTML документа.
+    """
+    yield HTML_HEAD_MINIFY if minify else HTML_HEAD_FULL
+
+    head = ['thead']
+    if not minify:
+        head += ['tfoot']
+    for elem in head:
+        yield f"\t\t<{elem}>\n\t\t<tr>\n"
+        yield ''.join([f'\t\t\t<th>{name}</th>\n' for name, key in HTML_FIELDS])
+        yield f"\t\t</tr>\n\t\t</{elem}>\n"
+
+    yield "\t\t<tbody>\n"
+    for config, rule, state in rows:
+        tr_class = []
+        if rule.disabled == '':
+            tr_class.append("disabled")
+        if state != '':
+            tr_class.append(state)
+
+        row = f'\t\t<tr class="{" ".join(tr_class)}">\n' if tr_class else '\t\t<tr>\n'
+        row += ''.join([f'\t\t\t<td>{config.get_full(rule, key)}</td>\n' for name, key in HTML_FIELDS])
+        row += '\t\t</tr>\n'
+        yield row
+
+    yield "\t\t</tbody>\n\t</table>\n"
+    if not minify:
+        yield '\t<script type="text/javascript" src="DataTables/main.js"></script>\n'
+    yield '</body>\n</html>'
+
+
+class CSVLine:
+    """
+    Приёмник csv.writer, возвращающий записанную строку вместо записи в файл
+    """
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+def iter_csv(results, header=True):
+    """
+    Формирует CSV отчёт (разделитель ';') построчно, с экранированием значений.
+
+    Args:
+        results (iterable): Пары (PFSense, список правил), например результат search_pfs.
+        header (bool): Выводить строку заголовка.
+
+    Yields:
+        str: Очередная строка CSV.
+    """
+    writer = csv.writer(CSVLine(), delimiter=';')
+    if header:
+        yield writer.writerow(CSV_HEADER)
+    for pf, rules in results:
+        for num, rule in enumerate(rules):
+            yield writer.writerow(format_rule(pf, rule, num, csv=True))
+
+
+def save_report(filename, chunks, encoding='UTF-8'):
+    """
+    Потоково записывает отчёт в файл.
+
+    Args:
+        filename (str): Путь к файлу отчёта.
+        chunks (iterable): Фрагменты отчёта (iter_html, iter_csv).
+        encoding (str): Кодировка файла.
+
+    Returns:
+        bool: True, если отчёт записан, в противном случае False.
+    """
+    try:
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w', encoding=encoding, newline='') as file:
+            file.writelines(chunks)
+    except Exception as e:
+        logger.exception(f'Failed to save report {filename}. Error: {e}')
+        return False
+    return True
+
+
+class ReportWriter:
+    """
+    Фоновая запись HTML/CSV отчётов по pfSense в пуле потоков.
+
+    Отчёты записываются только для pfSense с найденными правилами, отчёты предыдущего запроса
+    по pfSense без результатов удаляются, чтобы в каталоге не оставались устаревшие данные.
+    """
+
+    def __init__(self, directory='report', workers=4):
+        """
+        Args:
+            directory (str): Каталог отчётов.
+            workers (int): Количество одновременно записываемых отчётов.
+        """
+        self.html_dir = os.path.join(directory, 'html')
+        self.csv_dir = os.path.join(directory, 'csv')
+        self.diff_dir = os.path.join(directory, 'diff')
+        self.__executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='report')
+        self.__futures = []
+        # Имена файлов отчётов, записанных по предыдущему запросу
+        self.__written = set()
+        # Имена файлов отчётов об изменениях, записанных по предыдущему запросу
+        self.__written_diff = set()
+
+    def write(self, results):
+        """
+        Запускает запись отчётов по результатам поиска и сразу возвращает управление.
+
+        Args:
+            results (list): Пары (PFSense, список правил), например результат search_pfs.
+        """
+        # Отчёты предыдущего запроса должны быть записаны до начала записи новых
+        self.wait()
+
+        written = set()
+        for pf, rules in results:
+            if not rules:
+                continue
+            name = self.get_filename(pf.name)
+            written.add(name)
+            self.__futures.append(self.__executor.submit(self.__write_pf, pf, rules, name))
+
+        for name in self.__written - written:
+            self.__futures.append(self.__executor.submit(self.__remove, name))
+        self.__written = written
+
+    def write_diff(self, diffs):
+        """
+        Запускает запись HTML отчётов об изменениях правил и сразу возвращает управление.
+
+        Args:
+            diffs (list): Изменения по pfSense, например результат diff_pfs.
+        """
+        self.wait()
+
+        written = set()
+        for diff in diffs:
+            if not diff[3]:
+                continue
+            name = self.get_filename(diff[0].name)
+            written.add(name)
+            self.__futures.append(self.__executor.submit(
+                save_report, os.path.join(self.diff_dir, f'{name}.html'), iter_diff_html([diff])))
+
+        for name in self.__written_diff - written:
+            self.__futures.append(self.__executor.submit(self.__remove_diff, name))
+        self.__written_diff = written
+
+    def wait(self):
+        """
+        Ожидает завершения записи отчётов.
+        """
+        for future in self.__futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.exception(f'Failed to save report. Error: {e}')
+        self.__futures = []
+
+    def close(self):
+        """
+        Дожидается записи отчётов и останавливает пул потоков.
+        """
+        self.wait()
+        self.__executor.shutdown()
+
+    @staticmethod
+    def get_filename(name):
+        """
+        Имя файла отчёта по имени pfSense (без разделителей каталогов).
+        """
+        return ''.join('_' if char in '/\\:' else char for char in name)
+
+    def __write_pf(self, pf, rules, name):
+        save_report(os.path.join(self.html_dir, f'{name}.html'), iter_html([(pf, rules)]))
+        save_report(os.path.join(self.csv_dir, f'{name}.csv'), iter_csv([(pf, rules)]), encoding='utf-8-sig')
+
+    def __remove(self, name):
+        for filename in (os.path.join(self.html_dir, f'{name}.html'), os.path.join(self.csv_dir, f'{name}.csv')):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def __remove_diff(self, name):
+        filename = os.path.join(self.diff_dir, f'{name}.html')
+        if os.path.exists(filename):
+            os.remove(filename)
@@ -0,0 +1,71 @@
+from modules.rule.check import CompiledQuery
+from modules.rule.index import HomeIndex
+from modules.service.pfsense import IPQuery, PFSense
+
+
+def find_owners(inp_pfs, ip):
+    """
+    Находит pfSense, которым принадлежит IP (в сеть интерфейса которых он входит).
+
+    Args:
+        inp_pfs (tuple): Снимок pfSense.
+        ip (str): IP-адрес или сеть.
+
+    Returns:
+        list | None: Пары (PFSense, интерфейс) или None, если IP не разобран.
+    """
+    ip_query = IPQuery(ip)
+    if ip_query.range is None:
+        return None
+    return [(inp_pfs[position], interface) for position, interface in HomeIndex.get(inp_pfs).find(ip_query)]
+
+
+def search_rules(inp_pf, inp_query, home=True):
+    """
+    Ищет правила pfSense, подходящие под запрос, в порядке их обработки pfSense:
+    floating (quick), правила интерфейсов, floating (без quick).
+
+    Args:
+        inp_pf (PFSense): Объект PFSense.
+        inp_query (CompiledQuery): Скомпилированный запрос.
+        home (bool): Флаг домашней сети.
+
+    Returns:
+        list: Подходящие правила (RulePFSense).
+    """
+    if not inp_query.match_pf(inp_pf):
+        return []
+
+    config = inp_pf.config
+    # Правила-кандидаты по индексам адресов (если в запросе есть source/destination)
+    candidates = inp_query.candidates(config, home)
+    if candidates is None:
+        rules = config.ordered
+    else:
+        # Кандидаты упорядочиваются по заранее вычисленному порядку обработки, выключенные отбрасываются
+        order = config.order
+        rules = [config.ordered[position]
+                 for position in sorted(order[rule_id] for rule_id in candidates if order[rule_id] is not None)]
+
+    return [rule for rule in rules if inp_query.match_fields(rule)]
+
+
+def search_pfs(inp_pfs, inp_query):
+    """
+    Ищет правила, подходящие под запрос, на всех pfSense.
+
+    Args:
+        inp_pfs (list): Объекты PFSense.
+        inp_query (CompiledQuery): Скомпилированный запрос.
+
+    Yields:
+        tuple: (PFSense, список подходящих правил) для каждого pfSense в исходном порядке.
+    """
+    src_query = inp_query.query['src']
+    # Домашние pfSense по отношению к искомому source (None - все pfSense домашние)
+    homes = None
+    if src_query:
+        homes = HomeIndex.get(inp_pfs).homes(IPQuery(src_query['value']))
+
+    for position, pf in enumerate(inp_pfs):
+        yield pf, search_rules(pf, inp_query, homes is None or position in homes)
@@ -0,0 +1,240 @@
+from modules.rule.check import compile_field_match
+from modules.rule.format import format_verdict_dict
+from modules.service.pfsense import IPQuery
+
+# Допустимые поля описания потока
+FLOW_COMMANDS = ['pf', 'src', 'dst', 'proto', 'port', 'sport', 'in']
+
+
+class Flow:
+    """
+    Поток (пакет), для которого определяется решающее правило pfSense.
+    Правила с условием на поле, не указанное у потока, для него не определены.
+    """
+
+    def __init__(self, src=None, dst=None, proto=None, port=None, ingress=None, sport=None):
+        """
+        Args:
+            src (str): IP источника.
+            dst (str): IP назначения.
+            proto (str): Протокол (tcp, udp, icmp...).
+            port (str | int): Порт назначения.
+            ingress (str): Входящий интерфейс (имя или описание); по умолчанию - по сети source.
+            sport (str | int): Порт источника.
+
+        Raises:
+            ValueError: Если IP или порт не разобраны.
+        """
+        self.src = self.__parse_ip(src)
+        self.dst = self.__parse_ip(dst)
+        self.proto = str(proto).lower() if proto else None
+        self.port = self.__parse_port(port)
+        self.sport = self.__parse_port(sport)
+        self.ingress = str(ingress) if ingress else None
+
+    @staticmethod
+    def __parse_ip(ip):
+        if not ip:
+            return None
+        ip_range = IPQuery(str(ip)).range
+        if ip_range is None:
+            raise ValueError(f'Invalid IP: {ip}')
+        return ip_range
+
+    @staticmethod
+    def __parse_port(port):
+        if port in (None, ''):
+            return None
+        try:
+            return int(port)
+        except ValueError:
+            raise ValueError(f'Invalid port: {port}') from None
+
+    @classmethod
+    def from_query(cls, parsed_query):
+        """
+        Создаёт поток по разобранному запросу (поля FLOW_COMMANDS).
+        """
+        values = {key: (parsed_query.get(key) or {}).get('value') for key in FLOW_COMMANDS}
+        return cls(values['src'], values['dst'], values['proto'], values['port'], values['in'], values['sport'])
+
+
+def match_range(ip_range, condition, inverse):
+    """
+    Проверяет вхождение IP потока в адреса направления правила (с учётом инверсии).
+
+    Returns:
+        bool | None: Результат проверки или None, если он не определён: адреса правила неизвестны (FQDN, URL)
+                     или у потока не указан IP, а правило задаёт адреса.
+    """
+    if condition is None:
+        return not inverse
+    if ip_range is None:
+        return None
+    ranges, unresolved = condition
+    version, first, last, _ = ip_range
+    for net_version, net_first, net_last in ranges:
+        if version == net_version and net_first <= first and last <= net_last:
+            return not inverse
+    if version in unresolved:
+        return None
+    return inverse
+
+
+def match_ports(port, condition):
+    """
+    Проверяет вхождение порта потока в порты правила.
+
+    Args:
+        port (int | None): Порт потока.
+        condition (tuple | None): Порты правила (диапазоны, есть ли неразобранные порты).
+
+    Returns:
+        bool | None: Результат проверки или None, если он не определён: порты правила не разобраны
+                     или у потока не указан порт, а правило задаёт порты.
+    """
+    if condition is None:
+        return True
+    if port is None:
+        return None
+    ranges, unresolved = condition
+    if any(first <= port <= last for first, last in ranges):
+        return True
+    return None if unresolved else False
+
+
+def match_flow(rule, flow):
+    """
+    Проверяет, подходит ли поток под условия правила.
+
+    Args:
+        rule (RulePFSense): Правило с заполненным flow.
+        flow (Flow): Поток.
+
+    Returns:
+        bool | None: True, если правило применяется к потоку, или None, если это не определено:
+                     условия правила содержат неизвестные адреса или порты, либо правило задаёт поле,
+                     не указанное у потока.
+    """
+    version, protocols, src, src_inverse, dst, dst_inverse, ports, source_ports = rule.flow
+
+    # Проверки выполняются до первого несовпадения, неопределённый результат запоминается
+    result = True
+    if version is not None:
+        flow_ip = flow.src or flow.dst
+        if flow_ip is None:
+            result = None
+        elif flow_ip[0] != version:
+            return False
+    if protocols is not None:
+        if flow.proto is None:
+            result = None
+        elif flow.proto not in protocols:
+            return False
+    if ports is not None:
+        matched = match_ports(flow.port, ports)
+        if matched is False:
+            return False
+        result = result and matched
+    if source_ports is not None:
+        matched = match_ports(flow.sport, source_ports)
+        if matched is False:
+            return False
+        result = result and matched
+    matched = match_range(flow.src, src, src_inverse)
+    if matched is False:
+        return False
+    result = result and matched
+    matched = match_range(flow.dst, dst, dst_inverse)
+    if matched is False:
+        return False
+    return result and matched
+
+
+def flow_verdict(inp_pf, flow):
+    """
+    Определяет правило pfSense, принимающее решение по потоку:
+    floating (quick) - первое совпавшее, правила входящего интерфейса - первое совпавшее,
+    floating (без quick) - последнее совпавшее.
+
+    Правила, применимость которых к потоку не определена (match_flow вернул None),
+    не принимают решение, а возвращаются отдельно: любое из них могло решить судьбу потока раньше
+    найденного правила.
+
+    Args:
+        inp_pf (PFSense): Объект PFSense.
+        flow (Flow): Поток.
+
+    Returns:
+        tuple: (входящий интерфейс, решающее правило или None - блокировка по умолчанию,
+               список неопределённых правил, проверенных до решающего);
+               (None, None, []), если входящий интерфейс не определён.
+    """
+    config = inp_pf.config
+    ingress = config.get_ingress(flow)
+    if ingress is None:
+        return None, None, []
+
+    indeterminate = []
+    # Для floating без quick решает последнее совпавшее правило - они проверяются в обратном порядке
+    for rules in (config.flow_quick.get(ingress, config.flow_quick[None]),
+                  config.flow_interface.get(ingress, config.flow_interface[None]),
+                  reversed(config.flow_floating.get(ingress, config.flow_floating[None]))):
+        for rule in rules:
+            matched = match_flow(rule, flow)
+            if matched:
+                return ingress, rule, indeterminate
+            if matched is None:
+                indeterminate.append(rule)
+
+    return ingress, None, indeterminate
+
+
+def verdict_pfs(inp_pfs, flow, pf_query=None):
+    """
+    Определяет решающие правила для потока на всех pfSense.
+
+    Args:
+        inp_pfs (tuple): Снимок pfSense.
+        flow (Flow): Поток.
+        pf_query (dict, optional): Условие на имя pfSense из запроса.
+
+    Yields:
+        tuple: (PFSense, входящий интерфейс или None, если он не определён, решающее правило или None,
+               неопределённые правила).
+    """
+    check_pf = compile_field_match(pf_query)
+    for pf in inp_pfs:
+        if check_pf is not None and not check_pf(pf.name):
+            continue
+        yield pf, *flow_verdict(pf, flow)
+
+
+def check_flow(inp_pfs, flow_fields):
+    """
+    Определяет решающие правила для потока, заданного полями, на всех pfSense.
+
+    Args:
+        inp_pfs (tuple): Снимок pfSense.
+        flow_fields (dict): Поля потока (FLOW_COMMANDS).
+
+    Returns:
+        dict: Поток, решения pfSense (rows), pfSense, на которых не определён входящий интерфейс
+              (unknown_ingress), и ошибка (error), если поток не разобран.
+    """
+    flow_fields = {key: flow_fields[key] for key in FLOW_COMMANDS if flow_fields.get(key) not in (None, '')}
+    try:
+        flow = Flow(flow_fields.get('src'), flow_fields.get('dst'), flow_fields.get('proto'),
+                    flow_fields.get('port'), flow_fields.get('in'), flow_fields.get('sport'))
+    except ValueError as e:
+        return {'flow': flow_fields, 'rows': [], 'unknown_ingress': [], 'error': str(e)}
+
+    pf_query = {'method': '+', 'value': str(flow_fields['pf'])} if 'pf' in flow_fields else None
+    rows = []
+    unknown_ingress = []
+    for pf, ingress, rule, indeterminate in verdict_pfs(inp_pfs, flow, pf_query):
+        if ingress is None:
+            unknown_ingress.append(pf.name)
+        else:
+            rows.append(format_verdict_dict(pf, ingress, rule, indeterminate))
+    return {'flow': flow_fields, 'rows': rows, 'unknown_ingress': unknown_ingress, 'error': None}
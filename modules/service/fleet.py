@@ -0,0 +1,118 @@
+import copy
+import datetime
+import threading
+
+from modules.cache import store_prune
+from modules.log import logger
+from modules.service.pfsense import PFSense, parse_networks
+
+
+class PFSenseFleet:
+    """
+    Все pfSense, загруженные в память, с фоновым обновлением конфигураций.
+
+    Текущий набор pfSense хранится в неизменяемом кортеже self.pfs и заменяется целиком
+    одним присваиванием, поэтому поиск, взявший self.pfs, всегда видит согласованный снимок.
+    """
+    # Минимальный интервал фонового обновления (в секундах)
+    min_interval = 60
+
+    def __init__(self, routers, networks=None):
+        """
+        Args:
+            routers (list): Список pfSense в виде пар (имя, IP).
+            networks (dict, optional): Имя pfSense -> адреса интерфейсов из NetBox (NetboxInterface).
+        """
+        self.routers = list(routers)
+        # Имя pfSense -> сети интерфейсов из NetBox (разбираются один раз)
+        self.networks = {name: tuple(parse_networks(interfaces)) for name, interfaces in (networks or {}).items()}
+        self.pfs: tuple = ()
+        self.__refresh_lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def refresh(self):
+        """
+        Загружает конфигурации всех pfSense и атомарно заменяет текущий набор.
+
+        Модели правил pfSense с неизменившейся конфигурацией используются повторно без разбора,
+        а pfSense, конфигурацию которых не удалось получить, остаются в прежнем состоянии.
+        Объекты pfSense из текущего набора не изменяются: они могут использоваться выполняющимися запросами.
+        """
+        with self.__refresh_lock:
+            previous = {pf.ip: pf for pf in self.pfs}
+            loaded = {
+                pf.ip: pf
+                for pf in PFSense.run_all([PFSense(name=name, ip=ip) for name, ip in self.routers], previous)
+            }
+
+            pfs = []
+            for name, ip in self.routers:
+                pf = loaded.get(ip) or previous.get(ip)
+                if pf is None:
+                    continue
+                # Общий пустой кортеж: процессы поиска сравнивают сети по идентичности объекта
+                networks = self.networks.get(name, ())
+                if ip in loaded:
+                    pf.networks = networks
+                else:
+                    logger.warning(f"[{name}] Config refresh failed, previous config is used")
+                    if pf.networks is not networks:
+                        # Новые сети получает копия прежнего объекта, публикуемая только вместе с новым набором
+                        pf = copy.copy(pf)
+                        pf.networks = networks
+                pfs.append(pf)
+
+            changed = sum(1 for pf in pfs if previous.get(pf.ip) is None or previous[pf.ip].config is not pf.config)
+            self.pfs = tuple(pfs)
+            logger.info(f"Configs refreshed: {changed} changed, {len(pfs)} available")
+
+            # Из хранилища удаляются устаревшие снимки, не входящие в историю ни одного pfSense:
+            # история недоступных сейчас pfSense читается из кэша, чтобы их снимки не были потеряны
+            available = {pf.ip: pf for pf in pfs}
+            keep = {pf.config_hash for pf in pfs}
+            for _, ip in self.routers:
+                history = available[ip].history if ip in available else PFSense.load_history(ip)
+                keep.update(config_hash for _, config_hash in history)
+            removed = store_prune(keep, PFSense.settings['history']['days'])
+            if removed:
+                logger.debug(f"Removed {removed} expired config snapshots")
+        return self.pfs
+
+    @staticmethod
+    def get_interval(settings):
+        """
+        Интервал фонового обновления (в секундах) по времени жизни кэша конфигураций pfSense.
+        """
+        cache = settings['cache']['pfsense']['config']
+        interval = datetime.timedelta(days=cache['days'], hours=cache['hours'], minutes=cache['minutes'])
+        return max(PFSenseFleet.min_interval, interval.total_seconds())
+
+    def start(self, interval):
+        """
+        Запускает фоновое обновление конфигураций с заданным интервалом (в секундах).
+        """
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__refresh_loop, args=(interval,),
+                                         name='pfsense-refresh', daemon=True)
+        self.__thread.start()
+        logger.info(f"Background config refresh started (every {interval:.0f}s)")
+
+    def stop(self):
+        """
+        Останавливает фоновое обновление конфигураций.
+        """
+        if self.__thread is None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+
+    def __refresh_loop(self, interval):
+        while not self.__stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.exception(f"Background config refresh failed: {e}")
@@ -1,11 +1,34 @@
 import os
 
 import pynetbox
-import pynetbox.core.response
 
 from modules.cache import cache_get, cache_set
 from modules.log import logger
 
+# Версия формата кэша NetBox: роли - {имя: id}, устройства - [(имя, IP)], сети - {имя: [NetboxInterface]}
+NETBOX_CACHE_VERSION = 2
+# Количество виртуальных машин в одном запросе интерфейсов и IP-адресов
+NETBOX_CHUNK_SIZE = 100
+
+
+class NetboxInterface:
+    """
+    Адрес интерфейса виртуальной машины pfSense из NetBox.
+    Повторяет поля InterfacePFSense, используемые при поиске pfSense, которым принадлежит IP.
+    """
+    __slots__ = ('interface', 'descr', 'address')
+
+    def __init__(self, interface, descr, address):
+        self.interface = interface
+        self.descr = descr
+        self.address = address
+
+    def get_ip_desc(self):
+        return f"{self.descr} ({self.address})"
+
+    def get_ip_obj(self):
+        return self.address
+
 
 class NetboxAPI:
     __netbox_connection = None
@@ -25,9 +48,11 @@ class NetboxAPI:
             if not token:
                 logger.error("NetBox token is not set")
                 return False
+            # threading - страницы результатов запрашиваются параллельно
             cls.__netbox_connection = pynetbox.api(
                 url=url,
-                token=token
+                token=token,
+                threading=True
             )
             logger.debug("Connection to NetBox established")
             return True
@@ -45,7 +70,8 @@ class NetboxAPI:
             cache_file,
             days=cls.settings['cache']['netbox']['roles']['days'],
             hours=cls.settings['cache']['netbox']['roles']['hours'],
-            minutes=cls.settings['cache']['netbox']['roles']['minutes']
+            minutes=cls.settings['cache']['netbox']['roles']['minutes'],
+            version=NETBOX_CACHE_VERSION
         )
         if cache_data is not None:
             logger.debug("Roles loaded from cache")
@@ -54,8 +80,10 @@ class NetboxAPI:
 
         logger.debug("Getting roles from NetBox")
         try:
+            # Запрашиваются и кэшируются только имя и id роли
             roles = {
-                role.name: role for role in cls.__netbox_connection.dcim.device_roles.all()
+                role.name: role.id
+                for role in cls.__netbox_connection.dcim.device_roles.filter(fields='id,name')
             }
             logger.debug("Roles retrieved from NetBox API")
         except Exception as e:
@@ -63,12 +91,24 @@ class NetboxAPI:
             cls.roles = {}
             return False
 
-        cache_set(roles, cache_file)
+        cache_set(roles, cache_file, version=NETBOX_CACHE_VERSION, codec='json')
         cls.roles = roles
         return True
 
     @classmethod
-    def get_devices(cls, role: pynetbox.core.response.Record):
+    def get_devices(cls, role_id: int):
+        """
+        Получает виртуальные машины с заданной ролью.
+
+        Запрашиваются только имя и основной IPv4, страницы результатов загружаются параллельно;
+        в кэш сохраняются простые пары (имя, IP) без объектов pynetbox.
+
+        Args:
+            role_id (int): id роли устройства в NetBox.
+
+        Returns:
+            list: Пары (имя, IP) виртуальных машин с основным IPv4.
+        """
         logger.debug("Checking cache for devices")
         devices = []
         cache_file = "netbox_devices.pkl"
@@ -77,33 +117,92 @@ class NetboxAPI:
             cache_file,
             days=cls.settings['cache']['netbox']['devices']['days'],
             hours=cls.settings['cache']['netbox']['devices']['hours'],
-            minutes=cls.settings['cache']['netbox']['devices']['minutes']
+            minutes=cls.settings['cache']['netbox']['devices']['minutes'],
+            version=NETBOX_CACHE_VERSION
         )
         if cache_data is not None:
             logger.debug("Devices loaded from cache")
-            return cache_data
+            return [tuple(device) for device in cache_data]
 
         logger.debug("Getting devices from NetBox")
         try:
             devices_generator = cls.__netbox_connection.virtualization.virtual_machines.filter(
-                role_id=role.id
+                role_id=role_id,
+                fields='name,primary_ip4'
             )
-            devices = list(devices_generator)
+            for device in devices_generator:
+                if not device.primary_ip4:
+                    logger.warning(f"Device {device.name} has no primary IPv4 address, skipped")
+                    continue
+                devices.append((device.name, device.primary_ip4.address.split('/')[0]))
+            # Страницы приходят в порядке загрузки - порядок pfSense задаётся по имени
+            devices.sort()
             logger.debug("Devices retrieved from NetBox API")
         except Exception as e:
             logger.exception(f"An error occurred: {e}")
+            return devices
 
-        cache_set(devices, cache_file)
+        cache_set(devices, cache_file, version=NETBOX_CACHE_VERSION, codec='json')
         return devices
 
     @classmethod
-    def get_interfaces(cls, virtual_machine):
-        return cls.__netbox_connection.virtualization.interfaces.filter(
-            virtual_machine=virtual_machine.name
-        )
+    def get_networks(cls, router_names):
+        """
+        Получает адреса интерфейсов виртуальных машин pfSense.
 
-    @classmethod
-    def get_ip_addresses(cls, virtual_machine):
-        return cls.__netbox_connection.ipam.ip_addresses.filter(
-            virtual_machine=virtual_machine.name
+        Интерфейсы и IP-адреса запрашиваются пачками по NETBOX_CHUNK_SIZE виртуальных машин
+        (а не отдельным запросом на каждую) и сопоставляются по id интерфейса локально.
+
+        Args:
+            router_names (list): Имена виртуальных машин pfSense.
+
+        Returns:
+            dict: Имя pfSense -> список адресов интерфейсов (NetboxInterface).
+        """
+        logger.debug("Checking cache for networks")
+        cache_file = "netbox_networks.pkl"
+
+        cache_data = cache_get(
+            cache_file,
+            days=cls.settings['cache']['netbox']['networks']['days'],
+            hours=cls.settings['cache']['netbox']['networks']['hours'],
+            minutes=cls.settings['cache']['netbox']['networks']['minutes'],
+            version=NETBOX_CACHE_VERSION
         )
+        # Кэш используется, только если в нём есть все запрошенные pfSense
+        if cache_data is not None and set(router_names) <= cache_data.keys():
+            logger.debug("Networks loaded from cache")
+            return cache_data
+
+        logger.debug("Getting networks from NetBox")
+        networks = {name: [] for name in router_names}
+        try:
+            for num in range(0, len(router_names), NETBOX_CHUNK_SIZE):
+                chunk = list(router_names[num:num + NETBOX_CHUNK_SIZE])
+                # id интерфейса -> (имя pfSense, имя интерфейса, описание)
+                interfaces = {
+                    interface.id: (interface.virtual_machine.name, interface.name, interface.description)
+                    for interface in cls.__netbox_connection.virtualization.interfaces.filter(
+                        virtual_machine=chunk,
+                        fields='id,name,description,virtual_machine'
+                    )
+                }
+                for ip_address in cls.__netbox_connection.ipam.ip_addresses.filter(
+                        virtual_machine=chunk,
+                        fields='address,assigned_object_type,assigned_object_id'
+                ):
+                    if ip_address.assigned_object_type != 'virtualization.vminterface':
+                        continue
+                    interface = interfaces.get(ip_address.assigned_object_id)
+                    if interface is None:
+                        continue
+                    name, interface_name, description = interface
+                    networks.setdefault(name, []).append(
+                        NetboxInterface(interface_name, description or interface_name, ip_address.address))
+            logger.debug("Networks retrieved from NetBox API")
+        except Exception as e:
+            logger.exception(f"An error occurred: {e}")
+            return {}
+
+        cache_set(networks, cache_file, version=NETBOX_CACHE_VERSION)
+        return networks
@@ -1,23 +1,123 @@
 import datetime
+import hashlib
 import os
+import socket
+import sys
+import time
 import xml.etree.ElementTree
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import paramiko
-from netaddr import IPNetwork
+from netaddr import IPNetwork, IPRange
 
-from modules.cache import cache_get, cache_set
+from modules.cache import cache_get, cache_info, cache_load, cache_set, store_exists, store_open, store_put
+from modules.rule.index import AddressIndex, PortIndex
 from modules.log import logger
 
+# Версия модели правил: увеличивается при любом изменении структуры RulesPFSense,
+# чтобы сохранённые в кэше разобранные конфигурации автоматически стали недействительны
+MODEL_VERSION = 13
+
+# Версия формата истории снимков конфигурации pfSense: [(время, хеш конфигурации в хранилище)]
+HISTORY_VERSION = 1
+
+# Версия формата кэша загруженной конфигурации (хеш конфигурации в хранилище,
+# mtime и размер файла на pfSense - в заголовке)
+CONFIG_CACHE_VERSION = 3
+CONFIG_PATH = '/cf/conf/config.xml'
+
 NETWORK_ANY_STR = '0.0.0.0/0'
 NETWORK_ANY = IPNetwork(NETWORK_ANY_STR)
 NETWORK_SELF = IPNetwork('127.0.0.1/32')
+# Общий пустой словарь для необязательных описаний полей элементов (только для чтения)
+EMPTY_DICT = {}
+
+
+def parse_ip_range(input_str):
+    """
+    Разбирает IP-адрес или сеть в целочисленное представление.
+
+    Returns:
+        tuple: (версия, первый адрес, последний адрес, указанный адрес).
+    """
+    network = IPNetwork(input_str)
+    return network.version, network.first, network.last, network.value
+
+
+def parse_networks(interfaces):
+    """
+    Разбирает сети интерфейсов (InterfacePFSense или адресов интерфейсов из NetBox).
+
+    Returns:
+        list: [(версия, первый адрес, последний адрес, интерфейс)] интерфейсов с заданной сетью.
+    """
+    networks = []
+    for interface in interfaces:
+        ip_network_string = interface.get_ip_obj()
+        if not ip_network_string:
+            continue
+        try:
+            version, first, last, _ = parse_ip_range(ip_network_string)
+        except Exception:
+            continue
+        networks.append((version, first, last, interface))
+    return networks
+
+
+def parse_port_range(input_str):
+    """
+    Разбирает порт или диапазон портов (80, 1000:2000, 1000-2000).
+
+    Returns:
+        tuple | None: (первый порт, последний порт) или None, если строка не является портом.
+    """
+    first, _, last = input_str.replace('-', ':').partition(':')
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    first, last = int(first), int(last or first)
+    return min(first, last), max(first, last)
+
+
+class IPQuery:
+    """
+    IP-адрес (или сеть) из поискового запроса, разобранный один раз на весь поиск.
+    """
+
+    def __init__(self, ip: str):
+        self.ip = ip
+        self.range = self.__parse(ip)
+
+        # Если прописан any - дописываем маску
+        exact_ip = f'{ip}/0' if ip == '0.0.0.0' else ip
+        self.exact = self.range if exact_ip == ip else self.__parse(exact_ip)
+        # Если указана сеть - точное совпадение проверяется вместе с маской, иначе только по адресу
+        self.exact_network = '/' in exact_ip
+
+    @staticmethod
+    def __parse(ip):
+        try:
+            return parse_ip_range(ip)
+        except Exception as e:
+            logger.error(f"Error parsing IP ({ip}) from query. Error: {e}")
+            return None
+
+    def __str__(self):
+        return self.ip
 
 
 class NetPoint:
-    network = None
-    url = None
+    # Поля хранятся в слотах: у сотен тысяч адресов правил нет собственного __dict__
+    __slots__ = ('network', 'url', 'version', 'first', 'last', 'value', 'is_any')
 
     def __init__(self, input_str):
+        self.network = None
+        self.url = None
+        # Целочисленное представление сети (задаётся только для IP)
+        self.version = None
+        self.first = None
+        self.last = None
+        self.value = None
+        self.is_any = False
         if not self.parse_ip(input_str) and not self.parse_urls(input_str):
             logger.error(f'Error parsing NetPoint: "{input_str}"')
 
@@ -31,10 +131,17 @@ class NetPoint:
                 self.network = NETWORK_SELF
             else:
                 self.network = IPNetwork(input_str)
-            return True
         except Exception:
             return False
 
+        self.version = self.network.version
+        self.first = self.network.first
+        self.last = self.network.last
+        self.value = self.network.value
+        # Соответствует str(self) == '0.0.0.0/0'
+        self.is_any = self.version == 4 and self.value == 0 and self.network.prefixlen == 0
+        return True
+
     def parse_urls(self, input_str):
         if input_str:
             # Если хотим игнорировать удалённые интерфейсы
@@ -45,59 +152,53 @@ class NetPoint:
 
     def ip_in_range(self, ip):
         # Проверяем, задана ли сеть (а не url)
-        if not self.network:
+        if self.version is None:
             return False
 
-        try:
-            # Пытаемся преобразовать IP в IPNetwork
-            ip_obj = IPNetwork(ip)
-            # Проверяем, входит ли IP в сеть
-            if ip_obj in self.network:
-                return True
-        except Exception as e:
-            logger.exception(f"Error check IP ({ip}) in range. Error: {e}")
+        ip_query = ip if isinstance(ip, IPQuery) else IPQuery(ip)
+        if ip_query.range is None:
+            return False
 
-        return False
+        # Проверяем, входит ли IP в сеть
+        version, first, last, _ = ip_query.range
+        return version == self.version and self.first <= first and last <= self.last
 
     def ip_exact_match(self, ip_to_check):
         # Проверяем, задана ли сеть (а не url)
-        if not self.network:
+        if self.version is None:
             return False
 
-        try:
-            # Если прописан any - дописываем маску
-            if ip_to_check == '0.0.0.0':
-                ip_to_check += '/0'
-
-            ip_obj = IPNetwork(ip_to_check)
-
-            # Если указана сеть, проверяем полное соответствие (вместе с маской)
-            if '/' in ip_to_check:
-                if ip_obj == self.network:
-                    return True
-            # Если указан только адрес, проверяем без учёта маски
-            elif str(ip_obj.ip) == str(self.network.ip):
-                return True
-
-        except Exception as e:
-            logger.exception(f"Error checking IP ({ip_to_check}) for exact match. Error: {e}")
+        ip_query = ip_to_check if isinstance(ip_to_check, IPQuery) else IPQuery(ip_to_check)
+        if ip_query.exact is None:
+            return False
 
-        return False
+        version, first, last, value = ip_query.exact
+        if version != self.version:
+            return False
+        # Если указана сеть, проверяем полное соответствие (вместе с маской)
+        if ip_query.exact_network:
+            return first == self.first and last == self.last
+        # Если указан только адрес, проверяем без учёта маски
+        return value == self.value
 
     def __str__(self):
         return str(self.network) if self.network else self.url
 
 
 class ElementPFSense:
+    # Поля элементов хранятся в слотах, объявляемых наследниками: у экземпляров нет __dict__,
+    # что заметно уменьшает память, занимаемую сотнями тысяч правил
+    __slots__ = ('__elements_str', '__elements_list', '__elements_dict', '__replace')
+    __replace_def = {'-': '_'}
+
     def __init__(self, xml_tree: xml.etree.ElementTree.Element, elements_str=None, elements_list=None,
                  elements_dict=None, replace=None):
-        self.xml_tree = xml_tree
-
-        self.__elements_str = elements_str or {}
-        self.__elements_list = elements_list or []
-        self.__elements_dict = elements_dict or []
-        self.__replace = replace or {}
-        self.__replace_def = {'-': '_'}
+        # Описания полей передаются общими для всех экземпляров класса объектами,
+        # поэтому при сохранении модели в кэш они не дублируются для каждого элемента
+        self.__elements_str = elements_str if elements_str is not None else EMPTY_DICT
+        self.__elements_list = elements_list if elements_list is not None else ()
+        self.__elements_dict = elements_dict if elements_dict is not None else ()
+        self.__replace = replace if replace is not None else EMPTY_DICT
 
         for name in self.__elements_str:
             self.__setattr__(name, self.__elements_str[name])
@@ -118,13 +219,31 @@ class ElementPFSense:
 
         return elements_str_match and elements_list_match and elements_dict_match
 
+    def get_hash(self):
+        """
+        Хеш значений полей элемента (тех же, что сравнивает __eq__), одинаковый во всех процессах.
+        """
+        values = (
+            [self.__getattribute__(name) for name in self.__elements_str],
+            [self.__getattribute__(name) for name in self.__elements_list],
+            [sorted(self.__getattribute__(name).items()) for name in self.__elements_dict],
+        )
+        return hashlib.blake2b(repr(values).encode('UTF-8'), digest_size=16).digest()
+
     def __repr__(self):
         out_str = '\n'
-        for key, value in self.__dict__.items():
-            if key[0] != '_' and key != 'xml_tree':
-                out_str += f'{key:17} : {str(value):15}\n'
+        for key in self.slots():
+            if key[0] != '_' and hasattr(self, key):
+                out_str += f'{key:17} : {str(getattr(self, key)):15}\n'
         return f'[{out_str}]'
 
+    @classmethod
+    def slots(cls):
+        """
+        Имена всех слотов элемента (с учётом родительских классов)
+        """
+        return [name for klass in reversed(cls.__mro__) for name in klass.__dict__.get('__slots__', ())]
+
     @staticmethod
     def if_none(text, def_val='') -> str:
         """
@@ -151,7 +270,8 @@ class ElementPFSense:
             elem_name = self.__replace_tag(element.tag)
 
             if elem_name in element_mappings['element_str']:
-                self.__setattr__(elem_name, self.if_none(element.text))
+                # Повторяющиеся значения (тип, интерфейс, протокол...) хранятся в одном экземпляре
+                self.__setattr__(elem_name, sys.intern(self.if_none(element.text)))
 
             elif elem_name in element_mappings['element_list']:
                 sub_elements = [
@@ -174,7 +294,6 @@ class ElementPFSense:
 class ElementsPFSense:
     def __init__(self, xml_tree: xml.etree.ElementTree.Element,
                  item_class=None, search_name: str = '', filter_tag: str = ''):
-        self.xml_tree = xml_tree
         self.elements = []
         self.elements_dict = {}
 
@@ -205,11 +324,14 @@ class ElementsPFSense:
 
 
 class InterfacePFSense(ElementPFSense):
+    elements_str = {'enable': '', 'ifname': '', 'descr': '', 'ipaddr': '', 'subnet': '', 'gateway': '', 'spoofmac': ''}
+    replace = {'if': 'ifname'}
+    __slots__ = (*elements_str, 'interface')
+
     def __init__(self, xml_tree: xml.etree.ElementTree.Element):
         super().__init__(xml_tree,
-                         elements_str={'enable': '', 'ifname': '', 'descr': '', 'ipaddr': '', 'subnet': '',
-                                       'gateway': '', 'spoofmac': ''},
-                         replace={'if': 'ifname'})
+                         elements_str=self.elements_str,
+                         replace=self.replace)
         self.interface: str = xml_tree.tag
 
     def get_ip_desc(self):
@@ -228,9 +350,12 @@ class InterfacesPFSense(ElementsPFSense):
 
 
 class AliasPFSense(ElementPFSense):
+    elements_str = {'name': '', 'type': '', 'address': '', 'descr': '', 'detail': ''}
+    __slots__ = tuple(elements_str)
+
     def __init__(self, xml_tree: xml.etree.ElementTree.Element):
         super().__init__(xml_tree,
-                         elements_str={'name': '', 'type': '', 'address': '', 'descr': '', 'detail': ''})
+                         elements_str=self.elements_str)
 
 
 class AliasesPFSense(ElementsPFSense):
@@ -241,16 +366,42 @@ class AliasesPFSense(ElementsPFSense):
 
 
 class RulePFSense(ElementPFSense):
+    elements_str = {'id': '', 'tracker': '-', 'type': 'port forward', 'interface': 'all', 'ipprotocol': '',
+                    'tag': '', 'tagged': '', 'direction': '', 'floating': 'no', 'max': '',
+                    'max_src_nodes': '', 'max_src_conn': '', 'max_src_states': '',
+                    'statetimeout': '', 'statetype': '', 'os': '', 'protocol': 'any', 'descr': '',
+                    'quick': '', 'disabled': 'no', 'state': '', 'gateway': ''}
+    elements_list = ['source', 'destination']
+    elements_dict = ['updated', 'created']
+    # Поля, вычисляемые RulesPFSense после разбора
+    elements_full = ['floating_full', 'html_full']
+    elements_obj = ['rule_id', 'source_obj', 'destination_obj', 'destination_ports', 'port_ranges', 'flow']
+    __slots__ = (*elements_str, *elements_list, *elements_dict, *elements_full, *elements_obj)
+
     def __init__(self, xml_tree: xml.etree.ElementTree.Element):
         super().__init__(xml_tree,
-                         elements_str={'id': '', 'tracker': '-', 'type': 'port forward', 'interface': 'all',
-                                       'ipprotocol': '',
-                                       'tag': '', 'tagged': '', 'direction': '', 'floating': 'no', 'max': '',
-                                       'max_src_nodes': '', 'max_src_conn': '', 'max_src_states': '',
-                                       'statetimeout': '', 'statetype': '', 'os': '', 'protocol': 'any', 'descr': '',
-                                       'quick': '', 'disabled': 'no', 'state': '', 'gateway': ''},
-                         elements_list=['source', 'destination'],
-                         elements_dict=['updated', 'created'])
+                         elements_str=self.elements_str,
+                         elements_list=self.elements_list,
+                         elements_dict=self.elements_dict)
+        # Отображаемые (HTML) значения полей, вычисляются при первом обращении
+        self.html_full = None
+
+    # Поля, которые выводятся без преобразования
+    @property
+    def tracker_full(self):
+        return self.tracker
+
+    @property
+    def gateway_full(self):
+        return self.gateway
+
+    @property
+    def protocol_full(self):
+        return self.protocol
+
+    @property
+    def descr_full(self):
+        return self.descr
 
     @staticmethod
     def get_userdate(time_user: dict):
@@ -272,25 +423,76 @@ class FilterPFSense(ElementsPFSense):
 
 
 class RulesPFSense:
-    def __init__(self, xml_str: str = ''):
+    # Разделы конфигурации, необходимые для поиска; остальные пропускаются при разборе
+    sections = {'interfaces', 'aliases', 'filter'}
+    # Размер фрагмента конфигурации, передаваемого потоковому парсеру
+    chunk_size = 64 * 1024
+
+    def __init__(self, xml_data=''):
+        """
+        Args:
+            xml_data (str | bytes | mmap.mmap): XML конфигурации; разбирается фрагментами по chunk_size.
+        """
         self.interfaces: InterfacesPFSense
         self.aliases: AliasesPFSense
         self.filter: FilterPFSense
         self.search_name = ''
-        self.html = ''
-
-        self.xml_tree = xml.etree.ElementTree.fromstring(xml_str)
-        for element in self.xml_tree.findall('./'):
-            match element.tag:
-                case 'interfaces':
-                    self.interfaces = InterfacesPFSense(element)
-                case 'aliases':
-                    self.aliases = AliasesPFSense(element)
-                case 'filter':
-                    self.filter = FilterPFSense(element)
 
+        self.parse(xml_data[i:i + self.chunk_size] for i in range(0, len(xml_data), self.chunk_size))
+
+        self.source_index: AddressIndex
+        self.destination_index: AddressIndex
+
+        self.resolve_aliases()
         self.post_gen_full()
         self.post_gen_obj_search()
+        self.build_order()
+        self.build_index()
+        self.build_flows()
+        self.build_fingerprint()
+
+    def parse(self, chunks):
+        """
+        Потоковый разбор конфигурации: из XML извлекаются только интерфейсы, алиасы и правила,
+        остальные элементы удаляются из дерева сразу после их разбора.
+
+        Args:
+            chunks (iterable): Фрагменты XML конфигурации (str или bytes).
+        """
+        parser = xml.etree.ElementTree.XMLPullParser(events=('start', 'end'))
+        # Цепочка открытых элементов от корня до текущего
+        stack = []
+        section = None
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == 'start':
+                    stack.append(element)
+                    # Раздел верхнего уровня (дочерний элемент корня)
+                    if len(stack) == 2:
+                        section = element.tag
+                    continue
+
+                stack.pop()
+                # Корень конфигурации
+                if not stack:
+                    continue
+                if len(stack) == 1:
+                    match element.tag:
+                        case 'interfaces':
+                            self.interfaces = InterfacesPFSense(element)
+                        case 'aliases':
+                            self.aliases = AliasesPFSense(element)
+                        case 'filter':
+                            self.filter = FilterPFSense(element)
+                    section = None
+                elif section in self.sections:
+                    # Элементы нужных разделов сохраняются до разбора раздела целиком
+                    continue
+                # Завершённый элемент - последний дочерний элемент родителя: удаляем его из дерева
+                del stack[-1][-1]
+        parser.close()
 
     def __len__(self):
         return self.filter.__len__()
@@ -303,24 +505,85 @@ class RulesPFSense:
     def get_interface(self, interface):
         return self.interfaces[interface].get_ip_desc() if self.interfaces[interface] else interface
 
-    def get_alias(self, alias_name, child_num=0):
+    def resolve_aliases(self):
+        """
+        Однократное раскрытие вложенных алиасов: для каждого алиаса заранее вычисляются
+        плоский список адресов и список портов (подсказки для HTML - при первом обращении).
+        Правила ссылаются на общие вычисленные значения, циклические ссылки алиасов обрываются.
+        """
+        # Имя алиаса -> кортеж адресов
+        self.alias_addresses = {}
+        # Имя алиаса -> кортеж портов
+        self.alias_ports = {}
+        # (имя алиаса, уровень вложенности) -> подсказка HTML, заполняется по мере обращения
+        self.alias_titles = {}
+        # Адрес -> общий объект NetPoint
+        self.points = {}
+        # Алиасы, раскрытие которых доходит до циклической ссылки
+        self.alias_loops = self.find_alias_loops()
+
+        for alias in self.aliases:
+            # Порты раскрываются так же, как адреса: на всю глубину вложенности
+            self.alias_ports[alias.name] = self.get_obj_alias(alias.name)
+
+    def find_alias_loops(self):
+        """
+        Находит алиасы, раскрытие которых доходит до циклической ссылки алиасов.
+        Место обрыва цикла у таких алиасов зависит от цепочки, по которой к ним пришли,
+        поэтому раскрытие сохраняется только при обращении к самому алиасу.
+
+        Returns:
+            set: Имена алиасов.
+        """
+        reaches_loop = {}
+
+        def visit(alias_name, chain):
+            if alias_name in reaches_loop:
+                return reaches_loop[alias_name]
+            alias = self.aliases[alias_name]
+            if not alias:
+                return False
+            if alias_name in chain:
+                logger.warning(f"Alias loop: {' > '.join(chain + (alias_name,))}")
+                return True
+            chain += (alias_name,)
+            found = False
+            for address in alias.address.split(' '):
+                found = visit(address, chain) or found
+            reaches_loop[alias_name] = found
+            return found
+
+        for alias in self.aliases:
+            visit(alias.name, ())
+        return {alias_name for alias_name, found in reaches_loop.items() if found}
+
+    def get_alias(self, alias_name, child_num=0, chain=()):
+        cacheable = not chain or alias_name not in self.alias_loops
+        title = self.alias_titles.get((alias_name, child_num)) if cacheable else None
+        if title is not None:
+            return title
+
         new_line = '&#013;&#010;'
         child_start = '&nbsp;&nbsp;&nbsp;&nbsp;'
 
-        str_direction = ''
         # Ищем алиас по имени
         alias: AliasesPFSense = self.aliases[alias_name]
-        # Если алиас найден
-        if alias:
-            # Добавляем его название
-            str_direction += f"{alias_name}:{new_line}"
-            # Пробегаемся по его адресам
-            for address in alias.address.split(' '):
-                if address == alias.address.split(' ')[-1]:
-                    new_line = ''
-                str_direction += f"{child_start * child_num}{self.get_alias(address, child_num + 1)}{new_line}"
-        else:
-            str_direction = alias_name
+        # Если алиас не найден или ссылается сам на себя - выводим имя как есть
+        if not alias or alias_name in chain:
+            return alias_name
+
+        chain += (alias_name,)
+        addresses = alias.address.split(' ')
+        # Добавляем его название
+        str_direction = f"{alias_name}:{new_line}"
+        # Пробегаемся по его адресам
+        for address in addresses:
+            if address == addresses[-1]:
+                new_line = ''
+            str_direction += f"{child_start * child_num}{self.get_alias(address, child_num + 1, chain)}{new_line}"
+
+        if cacheable:
+            self.alias_titles[(alias_name, child_num)] = str_direction
         return str_direction
 
     def full_direction(self, direction):
@@ -384,40 +647,63 @@ class RulesPFSense:
 
     def get_ports(self, destination):
         ports = []
+        alias_ports = None
 
         for cnf in destination:
             if cnf['type'] != 'port':
                 continue
 
-            alias = self.aliases[cnf['value']]
-
-            if not alias:
+            alias_ports = self.alias_ports.get(cnf['value'])
+            if alias_ports is None:
                 ports.append(cnf['value'])
-                continue
-
-            for str_subalias in alias.address.split(' '):
-                subalias = self.aliases[str_subalias]
-
-                if subalias:
-                    ports.extend(subalias.address.split(' '))
-                else:
-                    ports.append(str_subalias)
+            else:
+                ports.extend(alias_ports)
 
+        # Единственный алиас портов - правило ссылается на общий кортеж
+        if alias_ports is not None and len(ports) == len(alias_ports):
+            return alias_ports
         return ports
 
     def post_gen_full(self):
         for rule in self.filter:
-            rule.tracker_full = rule.tracker
-            rule.gateway_full = rule.gateway
-            rule.protocol_full = rule.protocol
-            rule.descr_full = rule.descr
-            rule.type_full = self.full_type(rule.type)
-            rule.interface_full = self.full_interface(rule.interface)
-            rule.source_full = self.full_direction(rule.source)
-            rule.destination_full = self.full_direction(rule.destination)
             rule.floating_full = self.full_floating(rule.floating, rule.quick)
-            rule.created_full = rule.get_userdate(rule.created)
-            rule.updated_full = rule.get_userdate(rule.updated)
+
+    def get_full(self, rule, key):
+        """
+        Возвращает отображаемое (HTML) значение поля правила.
+        Значение вычисляется при первом обращении и сохраняется в правиле,
+        поэтому формирование отчёта зависит только от количества найденных правил.
+
+        Args:
+            rule (RulePFSense): Правило.
+            key (str): Имя поля правила.
+
+        Returns:
+            str: Отображаемое значение поля.
+        """
+        if rule.html_full is None:
+            rule.html_full = {}
+        elif key in rule.html_full:
+            return rule.html_full[key]
+
+        match key:
+            case 'type':
+                value = self.full_type(rule.type)
+            case 'interface':
+                value = self.full_interface(rule.interface)
+            case 'source':
+                value = self.full_direction(rule.source)
+            case 'destination':
+                value = self.full_direction(rule.destination)
+            case 'created':
+                value = rule.get_userdate(rule.created)
+            case 'updated':
+                value = rule.get_userdate(rule.updated)
+            case _:
+                return getattr(rule, f"{key}_full")
+
+        rule.html_full[key] = value
+        return value
 
     def get_obj_interface(self, interface):
         out = ''
@@ -425,19 +711,42 @@ class RulesPFSense:
             out = self.interfaces[interface].get_ip_obj()
         return out if out else f'interface-{interface}'
 
-    def get_obj_alias(self, alias_name):
-        list_direction = []
+    def get_obj_alias(self, alias_name, chain=()):
+        # Раскрытие алиаса с циклической ссылкой сохраняется только при обращении к самому алиасу
+        cacheable = not chain or alias_name not in self.alias_loops
+        list_direction = self.alias_addresses.get(alias_name) if cacheable else None
+        if list_direction is not None:
+            return list_direction
+
         # Ищем алиас по имени
         alias: AliasesPFSense = self.aliases[alias_name]
-        # Если алиас найден
-        if alias:
-            # Пробегаемся по его адресам
-            for address in alias.address.split(' '):
-                list_direction += self.get_obj_alias(address)
-        else:
-            list_direction.append(alias_name)
+        # Если алиас не найден - это адрес
+        if not alias:
+            return alias_name,
+        # Циклическая ссылка алиасов - имя алиаса считается адресом
+        if alias_name in chain:
+            return alias_name,
+
+        chain += (alias_name,)
+        # Пробегаемся по его адресам
+        list_direction = tuple(
+            item
+            for address in alias.address.split(' ')
+            for item in self.get_obj_alias(address, chain)
+        )
+        if cacheable:
+            self.alias_addresses[alias_name] = list_direction
         return list_direction
 
+    def get_point(self, address):
+        """
+        Возвращает общий для всех правил объект NetPoint для адреса.
+        """
+        point = self.points.get(address)
+        if point is None:
+            point = self.points[address] = NetPoint(address)
+        return point
+
     def obj_direction(self, direction, rule, path):
         inverse = False
         address = []
@@ -472,102 +781,225 @@ class RulesPFSense:
                 case 'not':
                     inverse = True
 
-        output = [NetPoint(i) for i in address] if address else []
+        output = [self.get_point(i) for i in address] if address else []
 
         return {'inverse': inverse, 'direction': output}
 
     def post_gen_obj_search(self):
-        for rule in self.filter:
+        for rule_id, rule in enumerate(self.filter):
+            rule.rule_id = rule_id
             rule.source_obj = self.obj_direction(rule.source, rule, path='src')
             rule.destination_obj = self.obj_direction(rule.destination, rule, path='dst')
             rule.destination_ports = self.get_ports(rule.destination)
+            # Числовые диапазоны портов (значения, не являющиеся портами, пропускаются)
+            rule.port_ranges = tuple(
+                port_range for port_range in map(parse_port_range, rule.destination_ports) if port_range)
+
+    def build_order(self):
+        """
+        Однократно определяет порядок обработки включённых правил pfSense:
+        floating (quick), правила интерфейсов, floating (без quick)
+        """
+        # Включённые правила в порядке обработки
+        self.ordered = [rule for rule in self.filter if rule.disabled == 'no' and rule.floating_full == 'yes (quick)']
+        self.ordered += [rule for rule in self.filter if rule.disabled == 'no' and rule.floating == 'no']
+        self.ordered += [rule for rule in self.filter if rule.disabled == 'no' and rule.floating == 'yes'
+                         and rule.quick == '']
+        # Номер правила -> позиция в порядке обработки (None - правило не обрабатывается)
+        self.order = [None] * len(self.filter)
+        for position, rule in enumerate(self.ordered):
+            self.order[rule.rule_id] = position
+
+    def build_index(self):
+        """
+        Строит индексы адресов source/destination для поиска по IP
+        и список сетей интерфейсов для определения домашнего pfSense
+        """
+        self.source_index = AddressIndex(self.filter, 'source_obj')
+        self.destination_index = AddressIndex(self.filter, 'destination_obj')
+        self.port_index = PortIndex(self.filter)
+
+        # [(версия, первый адрес, последний адрес, интерфейс)]
+        self.home_networks = parse_networks(self.interfaces)
 
-    def get_html(self, custom_rules=None, save=False, filename='', minify=True):
-        rules = custom_rules if custom_rules is not None else self.filter
-
-        if os.path.exists(filename):
-            os.remove(filename)
-
-        if not rules:
-            return
-
-        fields = [['tracker', 'tracker'], ['action', 'type'], ['floating', 'floating'], ['interface', 'interface'],
-                  ['protocol', 'protocol'], ['source', 'source'], ['destination', 'destination'],
-                  ['gateway', 'gateway'], ['description', 'descr'], ['created', 'created'], ['updated', 'updated']]
-        html_output = '''<html><head>
-    <meta charset="utf-8">
-</head>
-<body>
-    <style>
-    table{width:100%;margin:0 auto;clear:both;border-collapse:separate;border-spacing:0;border:1px solid #ababab;
-    font-size:12px}
-    table thead td,table thead th{padding:10px;border-bottom:1px solid rgba(0,0,0,.3)}
-    tbody tr:first-child td{border-top:none}tbody td{border-top:1px solid rgba(0,0,0,.15)}td,th{border-style:solid;
-    text-align:center!important}
-    tr:hover{background:#ffeb0052!important}
-    .disabled{background:repeating-linear-gradient(45deg,transparent 0 5px,#00000014 0 10px);color:#a7a7a7}
-    .disabled:hover{background:repeating-linear-gradient(45deg,transparent 0 5px,#00000014 0 10px)!important;color:#000}
-    .not{color:red;font-weight:700}th{text-transform:capitalize;border-color:#00000026;border-width:0 1 1 0}
-    body{margin:0}table thead th{padding:4px}thead th{font-size:15px;background-color:#bdbdbd}
-    td{padding:0 0 0 3px!important;border-width:0 1px 0 0;border-right-color:#00000026}html{font-family:sans-serif}
-    .add{background-color:#00ff0820!important}.del{background-color:#ff000020!important}
-    .chg_old{background:repeating-linear-gradient(45deg,transparent 0 5px,#0089ff20 0 10px)!important}
-    .chg_new{background-color:#0089ff20!important}.add:hover{background-color:#00ff0850!important}
-    .del:hover{background-color:#ff000050!important}
-    .chg_old:hover{background:repeating-linear-gradient(45deg,transparent 0 5px,#0089ff50 0 10px)!important}
-    .chg_new:hover{background-color:#0089ff50!important}
-    </style>
-    <table id='main_tbl' class='display'> 
-''' if minify else '''<html><head>
-    <meta charset="utf-8">
-    <link rel="stylesheet" type="text/css" href="DataTables/datatables.min.css"/>
-    <link rel="stylesheet" type="text/css" href="DataTables/main.css"/>
-    <script type="text/javascript" src="DataTables/jquery.min.js"></script>
-    <script type="text/javascript" src="DataTables/datatables.min.js"></script>
-</head>
-<body>
-    <table id='main_tbl' class='display'>
-'''
-
-        head = ['thead']
-        if not minify:
-            head += ['tfoot']
-        for elem in head:
-            html_output += f"\t\t<{elem}>\n\t\t<tr>\n"
-            html_output += ''.join([f'\t\t\t<th>{name}</th>\n' for name, key in fields])
-            html_output += f"\t\t</tr>\n\t\t</{elem}>\n"
-
-        html_output += "\t\t<tbody>\n"
-        for rule in rules:
-            tr_class = []
-            if rule.disabled == '':
-                tr_class.append("disabled")
-            if rule.state != '':
-                tr_class.append(rule.state)
-
-            html_output += f'\t\t<tr class="{" ".join(tr_class)}">\n' if tr_class else '\t\t<tr>\n'
-
-            html_output += ''.join([f'\t\t\t<td>{rule.__dict__[f"{key}_full"]}</td>\n' for name, key in fields])
-
-            html_output += '\t\t</tr>\n'
-
-        html_output += "\t\t</tbody>\n\t</table>\n"
-        if not minify:
-            html_output += '\t<script type="text/javascript" src="DataTables/main.js"></script>\n'
-        html_output += '</body>\n</html>'
-
-        self.html = html_output
-
-        if save:
-            self.save_html(filename)
-
-    def save_html(self, filename):
-        logger.info('Save report')
+    @staticmethod
+    def get_flow_range(address):
+        """
+        Разбирает адрес, сеть или диапазон адресов (10.0.0.1-10.0.0.9) в целочисленное представление.
+
+        Returns:
+            tuple | None: (версия, первый адрес, последний адрес) или None, если это не IP (FQDN, URL).
+        """
         try:
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
-            open(filename, 'w', encoding='UTF-8').write(self.html)
-        except Exception as e:
-            logger.exception(f'Failed to save report. Error: {e}')
+            if '-' in address:
+                address_range = IPRange(*address.split('-', 1))
+                return address_range.version, address_range.first, address_range.last
+            version, first, last, _ = parse_ip_range(address)
+            return version, first, last
+        except Exception:
+            return None
+
+    def get_flow_network(self, network):
+        """
+        Адреса сети интерфейса из условия правила: (self) - адреса всех интерфейсов pfSense,
+        <интерфейс>ip - адрес интерфейса, <интерфейс> - сеть интерфейса.
+
+        Returns:
+            tuple: (сети [(версия, первый адрес, последний адрес)], версии IP с неизвестными адресами).
+        """
+        # Адреса IPv6 интерфейсов из конфигурации не разбираются
+        if network == '(self)':
+            ranges = []
+            unresolved = {6}
+            for interface in self.interfaces:
+                if not interface.ipaddr:
+                    continue
+                address_range = self.get_flow_range(interface.ipaddr)
+                if address_range is None:
+                    # dhcp, pppoe и т.п. - адрес интерфейса неизвестен
+                    unresolved.add(4)
+                else:
+                    ranges.append(address_range)
+            return tuple(ranges), frozenset(unresolved)
+
+        interface = self.interfaces[network]
+        if interface:
+            address_range = self.get_flow_range(interface.get_ip_obj()) if interface.get_ip_obj() else None
+        elif network.endswith('ip') and self.interfaces[network[:-2]]:
+            address_range = self.get_flow_range(self.interfaces[network[:-2]].ipaddr)
+        else:
+            address_range = None
+        if address_range is None:
+            return (), frozenset((4, 6))
+        return (address_range,), frozenset((6,))
+
+    def get_flow_direction(self, direction):
+        """
+        Адреса направления (source/destination) правила для определения решения по потоку.
+
+        Returns:
+            tuple | None: (сети [(версия, первый адрес, последний адрес)], версии IP с неизвестными адресами)
+                          или None - любой адрес.
+        """
+        if any(i['type'] == 'any' for i in direction):
+            return None
+        ranges = []
+        unresolved = set()
+        for i in direction:
+            match i['type']:
+                case 'address':
+                    for address in self.get_obj_alias(i['value']):
+                        point = self.get_point(address)
+                        address_range = ((point.version, point.first, point.last) if point.version is not None
+                                         else self.get_flow_range(address))
+                        if address_range is None:
+                            # FQDN или URL - адреса неизвестны
+                            unresolved.update((4, 6))
+                        else:
+                            ranges.append(address_range)
+                case 'network':
+                    network_ranges, network_unresolved = self.get_flow_network(i['value'])
+                    ranges.extend(network_ranges)
+                    unresolved.update(network_unresolved)
+        return tuple(ranges), frozenset(unresolved)
+
+    @staticmethod
+    def get_flow_ports(ports, port_ranges):
+        """
+        Порты правила для определения решения по потоку.
+
+        Returns:
+            tuple | None: (диапазоны портов, есть ли неразобранные порты) или None - любой порт.
+        """
+        if not ports:
+            return None
+        return port_ranges, len(port_ranges) != len(ports)
+
+    def get_flow(self, rule):
+        """
+        Условия правила в целочисленном виде для определения решения по потоку (пакету).
+
+        Returns:
+            tuple: (версия IP, протоколы, адреса source, инверсия source, адреса destination,
+                    инверсия destination, порты destination, порты source); None - любое значение.
+        """
+        version = {'inet': 4, 'inet6': 6}.get(rule.ipprotocol)
+        protocols = None if rule.protocol in ('', 'any') else frozenset(rule.protocol.split('/'))
+        source_ports = self.get_ports(rule.source)
+        source_ranges = tuple(port_range for port_range in map(parse_port_range, source_ports) if port_range)
+        return (version, protocols,
+                self.get_flow_direction(rule.source), rule.source_obj['inverse'],
+                self.get_flow_direction(rule.destination), rule.destination_obj['inverse'],
+                self.get_flow_ports(rule.destination_ports, rule.port_ranges),
+                self.get_flow_ports(source_ports, source_ranges))
+
+    def build_flows(self):
+        """
+        Готовит правила для определения решения по потоку: условия каждого правила
+        и списки правил по входящему интерфейсу в порядке обработки pfSense
+        """
+        for rule in self.filter:
+            rule.flow = self.get_flow(rule)
+
+        # Правила, принимающие решение: floating - только для входящего трафика, без match
+        rules = [rule for rule in self.ordered if rule.type != 'match']
+        floating = [rule for rule in rules if rule.floating == 'yes' and rule.direction in ('', 'any', 'in')]
+
+        keys = {interface.interface for interface in self.interfaces}
+        keys.update(key for rule in rules for key in rule.interface.split(','))
+        keys -= {'any', 'all'}
+
+        def bucket(bucket_rules):
+            # Интерфейс -> правила; None - правила для неизвестных интерфейсов (any/all)
+            out = {key: [] for key in keys}
+            out[None] = []
+            for bucket_rule in bucket_rules:
+                interfaces = set(bucket_rule.interface.split(','))
+                for key in (out if interfaces & {'any', 'all'} else interfaces):
+                    out[key].append(bucket_rule)
+            return out
+
+        self.flow_quick = bucket([rule for rule in floating if rule.quick != ''])
+        self.flow_interface = bucket([rule for rule in rules if rule.floating == 'no'])
+        self.flow_floating = bucket([rule for rule in floating if rule.quick == ''])
+
+    def build_fingerprint(self):
+        """
+        Хеши полей правил по tracker для сравнения версий конфигурации.
+        Правила с одинаковым tracker различаются порядковым номером среди правил с этим tracker.
+        """
+        # (tracker, номер среди правил с этим tracker) -> (хеш полей, rule_id)
+        self.fingerprint = {}
+        occurrences = {}
+        for rule in self.filter:
+            occurrence = occurrences.get(rule.tracker, 0)
+            occurrences[rule.tracker] = occurrence + 1
+            self.fingerprint[(rule.tracker, occurrence)] = (rule.get_hash(), rule.rule_id)
+
+    def get_ingress(self, flow):
+        """
+        Определяет входящий интерфейс потока: указанный явно (имя или описание интерфейса)
+        или интерфейс, в сеть которого входит source (наиболее узкая сеть).
+
+        Returns:
+            str | None: Имя интерфейса или None, если интерфейс не определён.
+        """
+        if flow.ingress:
+            for interface in self.interfaces:
+                if flow.ingress.lower() in (interface.interface.lower(), interface.descr.lower()):
+                    return interface.interface
+            return flow.ingress
+
+        if flow.src is None:
+            return None
+        version, first, last, _ = flow.src
+        ingress = None
+        ingress_size = None
+        for net_version, net_first, net_last, interface in self.home_networks:
+            if version == net_version and net_first <= first and last <= net_last:
+                if ingress_size is None or net_last - net_first < ingress_size:
+                    ingress, ingress_size = interface.interface, net_last - net_first
+        return ingress
 
     @staticmethod
     def full_type(str_type):
@@ -589,13 +1021,31 @@ class PFSense:
         self.ip: str = ip
         self.port: int = port
         self.backup_path: str = backup_path or os.path.dirname(os.path.abspath(__file__))
-        self.xml_str: str = ''
-        self.xml_tree = None
+        # Хеш конфигурации в хранилище (сам XML в памяти не хранится)
+        self.config_hash: str = ''
         self.name: str = name
+        # Сети интерфейсов из NetBox: ((версия, первый адрес, последний адрес, интерфейс), ...)
+        self.networks: tuple = ()
+        # История снимков конфигурации: [(время появления, хеш конфигурации в хранилище)]
+        self.history: list = []
+        # Разобранные снимки конфигурации из истории: хеш конфигурации -> RulesPFSense
+        self.snapshots: dict = {}
+
+    def get_home_networks(self):
+        """
+        Сети интерфейсов pfSense: из конфигурации и из NetBox (кроме уже известных по конфигурации).
+
+        Returns:
+            list: [(версия, первый адрес, последний адрес, интерфейс)]
+        """
+        networks = list(self.config.home_networks) if self.config is not None else []
+        known = {network[:3] for network in networks}
+        networks.extend(network for network in self.networks if network[:3] not in known)
+        return networks
 
-    # Загрузка файла конфигурации в переменную self.xml_str
+    # Загрузка файла конфигурации в хранилище (self.config_hash - хеш загруженной конфигурации)
     def download_config(self):
-        logger.info('Trying to download config...')
+        logger.info(f'[{self.name}] Trying to download config...')
 
         # Проверка существования сегодняшнего файла конфигурации локально
         cache_file = f"pfsence_{self.ip}.pkl"
@@ -603,38 +1053,218 @@ class PFSense:
             cache_file,
             days=self.settings['cache']['pfsense']['config']['days'],
             hours=self.settings['cache']['pfsense']['config']['hours'],
-            minutes=self.settings['cache']['pfsense']['config']['minutes']
+            minutes=self.settings['cache']['pfsense']['config']['minutes'],
+            version=CONFIG_CACHE_VERSION
         )
-        if cache_data is not None:
+        if cache_data is not None and store_exists(cache_data):
             logger.debug(f"Config file {self.ip} loaded from cache")
-            self.xml_str = cache_data
+            self.config_hash = cache_data
             return True
 
+        # Устаревшая копия из хранилища используется повторно, если файл на pfSense не изменился
+        # (mtime и размер файла сверяются по заголовку кэша)
+        cache_meta = (cache_info(cache_file, version=CONFIG_CACHE_VERSION) or {}).get('meta')
+
         # Загрузка файла конфигурации
+        timeout = self.settings['pfsense']['fetch']['timeout']
         try:
             logger.debug(f"Trying to connect to {self.ip}:{self.port}!")
-            with paramiko.Transport((self.ip, self.port)) as transport:
+            # Таймаут ограничивает каждый этап: подключение, баннер, рукопожатие, авторизацию и чтение
+            sock = socket.create_connection((self.ip, self.port), timeout=timeout)
+            with paramiko.Transport(sock) as transport:
+                transport.banner_timeout = timeout
+                transport.handshake_timeout = timeout
+                transport.auth_timeout = timeout
                 transport.connect(username=os.getenv('PFSENSE_LOGIN'), password=os.getenv('PFSENSE_PASSWORD'))
                 with paramiko.SFTPClient.from_transport(transport) as sftp:
-                    self.xml_str = sftp.file('/cf/conf/config.xml', 'r').read().decode('UTF-8')
-
-            # Сохранение загруженного файла конфигурации
-            logger.debug(f"Config file {self.ip} loaded and saved to cache")
-            cache_set(self.xml_str, cache_file)
+                    sftp.get_channel().settimeout(timeout)
+                    attr = sftp.stat(CONFIG_PATH)
+                    meta = {'mtime': attr.st_mtime, 'size': attr.st_size}
+                    config_hash = None
+                    if cache_meta == meta:
+                        config_hash = cache_load(cache_file, version=CONFIG_CACHE_VERSION)
+                        if store_exists(config_hash):
+                            logger.debug(f"Config file {self.ip} not changed, cached copy is used")
+                        else:
+                            config_hash = None
+                    if config_hash is None:
+                        with sftp.file(CONFIG_PATH, 'rb') as file:
+                            # Файл читается блоками сразу в хранилище, с упреждающим чтением
+                            file.prefetch(attr.st_size)
+                            config_hash = store_put(file)
+                        logger.debug(f"Config file {self.ip} loaded")
+
+            self.config_hash = config_hash
+            # Сохранение ссылки на конфигурацию (или обновление времени проверки неизменённого файла)
+            cache_set(config_hash, cache_file, version=CONFIG_CACHE_VERSION, codec='json', meta=meta)
 
             return True
         except paramiko.AuthenticationException:
             logger.error(f"Authentication failed for {self.ip}:{self.port}!")
         except paramiko.SSHException as e:
-            logger.error(f"SSH error occurred: {e}")
+            logger.error(f"SSH error occurred ({self.ip}:{self.port}): {e}")
         except paramiko.sftp.SFTPError as e:
-            logger.error(f"SFTP error occurred: {e}")
+            logger.error(f"SFTP error occurred ({self.ip}:{self.port}): {e}")
+        except OSError as e:
+            logger.error(f"Connection error occurred ({self.ip}:{self.port}): {e}")
         except Exception as e:
-            logger.exception(f"An error occurred: {e}")
+            logger.exception(f"An error occurred ({self.ip}:{self.port}): {e}")
 
         return False
 
-    def run(self):
+    # Получение разобранной модели правил: из кэша (если конфигурация не менялась)
+    # или разбором конфигурации, отображённой в память из хранилища
+    def load_config(self, previous=None):
+        # Модель, уже загруженная в память, используется повторно без разбора
+        if previous is not None and previous.config is not None and previous.config_hash == self.config_hash:
+            logger.debug(f"Rules model {self.ip} not changed")
+            self.config = previous.config
+            return True
+
+        cache_file = f"pfsense_model_{self.ip}.pkl"
+        cache_data = cache_load(cache_file, version=MODEL_VERSION)
+        if cache_data is not None and cache_data.get('hash') == self.config_hash:
+            logger.debug(f"Rules model {self.ip} loaded from cache")
+            self.config = cache_data['config']
+            return True
+
+        try:
+            with store_open(self.config_hash) as xml_data:
+                self.config = RulesPFSense(xml_data)
+        except OSError as e:
+            logger.error(f"Config file {self.ip} is not available in the config store: {e}")
+            return False
+        logger.debug(f"Rules model {self.ip} parsed and saved to cache")
+        cache_set({'hash': self.config_hash, 'config': self.config}, cache_file, version=MODEL_VERSION)
+        return True
+
+    @staticmethod
+    def load_history(ip):
+        """
+        Читает историю снимков конфигурации pfSense из кэша.
+
+        Args:
+            ip (str): IP-адрес pfSense.
+
+        Returns:
+            list: [(время появления, хеш конфигурации в хранилище)].
+        """
+        return [tuple(item) for item in cache_load(f"pfsense_history_{ip}.pkl", version=HISTORY_VERSION) or []]
+
+    def update_history(self):
+        """
+        Добавляет текущую конфигурацию в историю снимков, если она изменилась, и удаляет снимки
+        старше срока хранения, кроме последнего из них (он действовал на начало срока хранения).
+        """
+        cache_file = f"pfsense_history_{self.ip}.pkl"
+        history = self.load_history(self.ip)
+        changed = False
+        if not history or history[-1][1] != self.config_hash:
+            history.append((time.time(), self.config_hash))
+            changed = True
+
+        cutoff = time.time() - datetime.timedelta(days=self.settings['history']['days']).total_seconds()
+        expired = [num for num, (timestamp, _) in enumerate(history) if timestamp < cutoff]
+        if len(expired) > 1:
+            history = history[expired[-1]:]
+            changed = True
+
+        if changed:
+            cache_set(history, cache_file, version=HISTORY_VERSION, codec='json')
+        self.history = history
+
+    def load_snapshot(self, config_hash):
+        """
+        Возвращает модель правил снимка конфигурации из истории. Снимок разбирается из хранилища
+        один раз и остаётся в памяти, пока он есть в истории pfSense.
+
+        Args:
+            config_hash (str): Хеш конфигурации в хранилище.
+
+        Returns:
+            RulesPFSense: Модель правил снимка.
+
+        Raises:
+            OSError: Если снимка нет в хранилище.
+        """
+        if config_hash == self.config_hash and self.config is not None:
+            return self.config
+        config = self.snapshots.get(config_hash)
+        if config is None:
+            with store_open(config_hash) as xml_data:
+                config = RulesPFSense(xml_data)
+            self.snapshots[config_hash] = config
+        return config
+
+    def get_snapshot(self, since):
+        """
+        Снимок конфигурации, действовавший в момент since (или самый ранний известный снимок).
+
+        Args:
+            since (float): Время (timestamp).
+
+        Returns:
+            tuple | None: (время появления снимка, хеш конфигурации) или None, если истории нет.
+        """
+        if not self.history:
+            return None
+        snapshot = self.history[0]
+        for item in self.history:
+            if item[0] > since:
+                break
+            snapshot = item
+        return snapshot
+
+    def run(self, previous=None):
+        start = time.perf_counter()
         self.download_config()
-        if self.xml_str:
-            self.config = RulesPFSense(self.xml_str)
+        if self.config_hash:
+            self.load_config(previous)
+        if self.config is not None:
+            self.update_history()
+            if previous is not None:
+                # Разобранные снимки (и прежняя текущая конфигурация) переходят к новому объекту,
+                # пока они остаются в истории
+                snapshots = dict(previous.snapshots)
+                if previous.config is not None:
+                    snapshots[previous.config_hash] = previous.config
+                hashes = {config_hash for _, config_hash in self.history if config_hash != self.config_hash}
+                self.snapshots = {config_hash: config for config_hash, config in snapshots.items()
+                                  if config_hash in hashes}
+        logger.info(f"[{self.name}] Config {'loaded' if self.config is not None else 'not loaded'} "
+                    f"in {time.perf_counter() - start:.2f}s")
+        return self.config is not None
+
+    @classmethod
+    def run_all(cls, pfs, previous=None):
+        """
+        Параллельно загружает и разбирает конфигурации всех pfSense.
+
+        Args:
+            pfs (list): Список объектов PFSense.
+            previous (dict, optional): Ранее загруженные PFSense по IP. Их модели правил
+                используются повторно, если конфигурация не изменилась.
+
+        Returns:
+            list: Объекты PFSense с успешно загруженной конфигурацией (в исходном порядке).
+        """
+        previous = previous or {}
+        workers = max(1, int(cls.settings['pfsense']['fetch']['workers']))
+        logger.info(f"Loading configs of {len(pfs)} pfSense ({workers} workers)")
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pfsense') as executor:
+            futures = {executor.submit(pf.run, previous.get(pf.ip)): pf for pf in pfs}
+            for future in as_completed(futures):
+                pf = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.exception(f"[{pf.name}] Failed to load config: {e}")
+
+        loaded = [pf for pf in pfs if pf.config is not None]
+        logger.info(f"Loaded {len(loaded)}/{len(pfs)} configs in {time.perf_counter() - start:.2f}s")
+        for pf in pfs:
+            if pf.config is None:
+                logger.warning(f"[{pf.name}] Config is unavailable, pfSense excluded from search")
+        return loaded
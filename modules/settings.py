@@ -1,5 +1,69 @@
+import copy
+
 import yaml
 
+DEFAULT_SETTINGS = {
+    'cache': {
+        'netbox': {
+            'roles': {
+                'days': 1, 'hours': 0, 'minutes': 0
+            },
+            'devices': {
+                'days': 1, 'hours': 0, 'minutes': 0
+            },
+            'networks': {
+                'days': 1, 'hours': 0, 'minutes': 0
+            }
+        },
+        'pfsense': {
+            'config': {
+                'days': 0, 'hours': 1, 'minutes': 0
+            }
+        }
+    },
+    'pfsense': {
+        'fetch': {
+            # Количество одновременно загружаемых конфигураций
+            'workers': 16,
+            # Таймаут (в секундах) на подключение и чтение для одного pfSense
+            'timeout': 30
+        }
+    },
+    'history': {
+        # Срок хранения снимков конфигураций pfSense (в днях) для сравнения версий правил
+        'days': 90
+    },
+    'search': {
+        # Количество процессов поиска: 1 - поиск в основном процессе, 0 - по числу ядер процессора
+        'workers': 1
+    },
+    'report': {
+        # Сохранять HTML/CSV отчёты по результатам поиска
+        'enabled': True,
+        # Каталог отчётов
+        'dir': 'report',
+        # Количество одновременно записываемых отчётов
+        'workers': 4
+    }
+}
+
+
+def merge_defaults(settings_data, defaults):
+    """
+    Дополняет настройки отсутствующими значениями по умолчанию.
+
+    Returns:
+        bool: True, если были добавлены новые значения, в противном случае False.
+    """
+    changed = False
+    for key, value in defaults.items():
+        if key not in settings_data:
+            settings_data[key] = copy.deepcopy(value)
+            changed = True
+        elif isinstance(value, dict) and isinstance(settings_data[key], dict):
+            changed = merge_defaults(settings_data[key], value) or changed
+    return changed
+
 
 def read_settings(settings_path="settings.yaml"):
     try:
@@ -8,24 +72,11 @@ def read_settings(settings_path="settings.yaml"):
     except (FileNotFoundError, yaml.YAMLError):
         settings_data = None
 
-    if settings_data is None:
-        settings_data = {
-            'cache': {
-                'netbox': {
-                    'roles': {
-                        'days': 1, 'hours': 0, 'minutes': 0
-                    },
-                    'devices': {
-                        'days': 1, 'hours': 0, 'minutes': 0
-                    }
-                },
-                'pfsense': {
-                    'config': {
-                        'days': 0, 'hours': 1, 'minutes': 0
-                    }
-                }
-            }
-        }
+    if not isinstance(settings_data, dict):
+        settings_data = {}
+
+    # Новые параметры дописываем в существующий файл настроек
+    if merge_defaults(settings_data, DEFAULT_SETTINGS):
         with open(settings_path, "w") as file:
             yaml.dump(settings_data, file)
 
@@ -0,0 +1,37 @@
+import pytest
+
+from modules.service.pfsense import RulesPFSense
+
+ALIASES = {
+    'alias_a': 'alias_b 10.0.0.1',
+    'alias_b': 'alias_a 10.0.0.2',
+    'alias_c': 'alias_a 10.0.0.3',
+}
+
+
+def make_config(names):
+    aliases = ''.join(f'<alias><name>{name}</name><type>host</type><address>{ALIASES[name]}</address></alias>'
+                      for name in names)
+    return RulesPFSense(f'<pfsense><interfaces></interfaces><aliases>{aliases}</aliases><filter></filter></pfsense>')
+
+
+@pytest.mark.parametrize('names', [
+    ('alias_a', 'alias_b', 'alias_c'),
+    ('alias_b', 'alias_a', 'alias_c'),
+    ('alias_c', 'alias_b', 'alias_a'),
+])
+def test_alias_loop_does_not_depend_on_lookup_order(names):
+    """
+    Раскрытие алиасов с циклической ссылкой A > B > A не зависит от порядка обращения к ним.
+    """
+    config = make_config(names)
+    assert config.alias_loops == {'alias_a', 'alias_b', 'alias_c'}
+    assert config.get_obj_alias('alias_a') == ('alias_a', '10.0.0.2', '10.0.0.1')
+    assert config.get_obj_alias('alias_b') == ('alias_b', '10.0.0.1', '10.0.0.2')
+    assert config.get_obj_alias('alias_c') == ('alias_a', '10.0.0.2', '10.0.0.1', '10.0.0.3')
+
+    # Подсказки HTML формируются при обращении: порядок обращения противоположен эталонному
+    reference = make_config(('alias_a', 'alias_b', 'alias_c'))
+    expected = {name: reference.get_alias(name) for name in ('alias_a', 'alias_b', 'alias_c')}
+    assert {name: config.get_alias(name) for name in reversed(names)} == expected
+    assert expected['alias_b'].startswith('alias_b:') and 'alias_a:' in expected['alias_b']
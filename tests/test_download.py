@@ -0,0 +1,169 @@
+import copy
+import os
+import socket
+import threading
+import time
+
+import paramiko
+import pytest
+
+from modules.cache import store_open
+from modules.service.pfsense import CONFIG_PATH, PFSense
+from modules.settings import DEFAULT_SETTINGS
+
+HOST_KEY = paramiko.RSAKey.generate(1024)
+
+
+class StubServer(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if (username, password) == ('admin', 'secret') else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class StubHandle(paramiko.SFTPHandle):
+    def __init__(self, file):
+        super().__init__()
+        self.readfile = file
+
+
+def stub_sftp(root, requests):
+    """
+    SFTP-сервер, отдающий файлы из каталога root и считающий запросы stat и open.
+    """
+    class StubSFTP(paramiko.SFTPServerInterface):
+        @staticmethod
+        def path(remote_path):
+            return os.path.join(root, os.path.basename(remote_path))
+
+        def stat(self, remote_path):
+            requests['stat'] += 1
+            try:
+                return paramiko.SFTPAttributes.from_stat(os.stat(self.path(remote_path)))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+
+        lstat = stat
+
+        def open(self, remote_path, flags, attr):
+            requests['open'] += 1
+            return StubHandle(open(self.path(remote_path), 'rb'))
+
+    return StubSFTP
+
+
+def listen(handle):
+    """
+    Принимает подключения на свободном порту 127.0.0.1 и передаёт их обработчику в отдельных потоках.
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(10)
+
+    def accept():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    # Кэш и хранилище конфигураций создаются во временном каталоге
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PFSENSE_LOGIN', 'admin')
+    monkeypatch.setenv('PFSENSE_PASSWORD', 'secret')
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    settings['cache']['pfsense']['config'] = {'days': 0, 'hours': 0, 'minutes': 0}
+    settings['pfsense']['fetch']['timeout'] = 1
+    monkeypatch.setattr(PFSense, 'settings', settings)
+    return settings
+
+
+@pytest.fixture
+def sftp_server(tmp_path):
+    root = tmp_path / 'pfsense'
+    root.mkdir()
+    (root / os.path.basename(CONFIG_PATH)).write_text(
+        '<pfsense><interfaces></interfaces><aliases></aliases><filter></filter></pfsense>')
+    requests = {'stat': 0, 'open': 0}
+
+    def handle(conn):
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(HOST_KEY)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, stub_sftp(str(root), requests))
+        transport.start_server(server=StubServer())
+
+    server = listen(handle)
+    yield server.getsockname()[1], root / os.path.basename(CONFIG_PATH), requests
+    server.close()
+
+
+@pytest.fixture
+def silent_server():
+    # Принимает TCP-подключения, но не отвечает (зависший pfSense)
+    connections = []
+    server = listen(connections.append)
+    yield server.getsockname()[1]
+    server.close()
+    for conn in connections:
+        conn.close()
+
+
+def test_download_skips_unchanged_config(settings, sftp_server):
+    port, config_file, requests = sftp_server
+
+    pf = PFSense(name='pf', ip='127.0.0.1', port=port)
+    assert pf.download_config()
+    assert requests['open'] == 1
+    with store_open(pf.config_hash) as data:
+        assert bytes(data) == config_file.read_bytes()
+
+    # Время и размер файла не изменились - файл не скачивается повторно
+    again = PFSense(name='pf', ip='127.0.0.1', port=port)
+    assert again.download_config()
+    assert again.config_hash == pf.config_hash
+    assert requests == {'stat': 2, 'open': 1}
+
+    config_file.write_text('<pfsense><interfaces></interfaces><aliases></aliases><filter><rule></rule></filter></pfsense>')
+    changed = PFSense(name='pf', ip='127.0.0.1', port=port)
+    assert changed.download_config()
+    assert changed.config_hash != pf.config_hash
+    assert requests['open'] == 2
+
+
+def test_download_uses_fresh_cache_without_connecting(settings, sftp_server):
+    port, _, requests = sftp_server
+    settings['cache']['pfsense']['config']['minutes'] = 10
+
+    assert PFSense(name='pf', ip='127.0.0.1', port=port).download_config()
+    assert PFSense(name='pf', ip='127.0.0.1', port=port).download_config()
+    assert requests == {'stat': 1, 'open': 1}
+
+
+def test_download_times_out(settings, silent_server):
+    pf = PFSense(name='pf', ip='127.0.0.1', port=silent_server)
+    start = time.monotonic()
+    assert not pf.download_config()
+    assert time.monotonic() - start < 5
+    assert pf.config_hash == ''
+
+
+def test_run_all_is_not_held_up_by_silent_router(settings, sftp_server, silent_server):
+    port, _, _ = sftp_server
+    pfs = [PFSense(name='silent', ip='127.0.0.1', port=silent_server),
+           PFSense(name='pf', ip='127.0.0.1', port=port)]
+
+    start = time.monotonic()
+    loaded = PFSense.run_all(pfs)
+    assert [pf.name for pf in loaded] == ['pf']
+    assert time.monotonic() - start < 5
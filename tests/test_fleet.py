@@ -0,0 +1,32 @@
+import copy
+
+from modules.service import fleet
+from modules.service.fleet import PFSenseFleet
+from modules.service.pfsense import PFSense, RulesPFSense
+from modules.settings import DEFAULT_SETTINGS
+
+CONFIG = ('<pfsense><interfaces><lan><if>vtnet0</if><descr>LAN</descr><ipaddr>10.0.0.1</ipaddr>'
+          '<subnet>24</subnet></lan></interfaces><aliases></aliases><filter></filter></pfsense>')
+
+
+def test_refresh_does_not_change_published_routers(monkeypatch):
+    monkeypatch.setattr(PFSense, 'settings', copy.deepcopy(DEFAULT_SETTINGS))
+    # Конфигурацию получить не удалось - используется прежний объект pfSense
+    monkeypatch.setattr(PFSense, 'run_all', classmethod(lambda cls, pfs, previous=None: []))
+    monkeypatch.setattr(PFSense, 'load_history', staticmethod(lambda ip: []))
+    monkeypatch.setattr(fleet, 'store_prune', lambda keep, days: 0)
+
+    routers = PFSenseFleet([('pf', '192.0.2.1')])
+    published = PFSense(name='pf', ip='192.0.2.1')
+    published.config = RulesPFSense(CONFIG)
+    routers.pfs = (published,)
+    routers.networks = {'pf': (object(),)}
+
+    pfs = routers.refresh()
+    assert published.networks == ()
+    assert pfs[0] is not published
+    assert pfs[0].config is published.config
+    assert pfs[0].networks is routers.networks['pf']
+
+    # Сети не изменились - объект используется повторно
+    assert routers.refresh()[0] is pfs[0]
@@ -0,0 +1,161 @@
+import random
+
+import pytest
+
+from modules.input_query import parse_search_query
+from modules.rule.check import CompiledQuery
+from modules.rule.index import HomeIndex
+from modules.rule.search import search_rules
+from modules.service.pfsense import IPQuery, PFSense, RulesPFSense
+
+COMMANDS = ['pf', 'act', 'desc', 'src', 'dst', 'port']
+INTERFACES = ['wan', 'lan'] + [f'opt{i}' for i in range(1, 6)]
+
+
+def generate_config(rng, seed, rules=300, aliases=40):
+    """
+    Формирует конфигурацию pfSense со случайными правилами: адреса, сети, интерфейсы, any,
+    вложенные алиасы адресов и портов, инверсия, одиночные порты и диапазоны портов.
+    """
+    out = ['<pfsense><interfaces>']
+    for num, name in enumerate(INTERFACES):
+        address = '<ipaddr>dhcp</ipaddr>' if name == 'wan' else f'<ipaddr>10.{seed}.{num}.1</ipaddr><subnet>24</subnet>'
+        out.append(f'<{name}><if>vtnet{num}</if><descr>IF_{name.upper()}</descr>{address}</{name}>')
+    out.append('</interfaces><aliases>')
+
+    address_aliases, port_aliases = [], []
+    for num in range(aliases):
+        if rng.random() < 0.4:
+            name = f'ports_{num}'
+            pool = [str(rng.choice([22, 80, 443, 8080])), f'{rng.randint(1000, 2000)}:{rng.randint(2000, 3000)}']
+            pool += port_aliases[-2:]
+            port_aliases.append(name)
+            alias_type = 'port'
+        else:
+            name = f'hosts_{num}'
+            pool = [f'10.{rng.randint(0, 3)}.{rng.randint(0, 5)}.{rng.randint(0, 255)}',
+                    f'10.{rng.randint(0, 3)}.{rng.randint(0, 5)}.0/24', '192.168.0.0/16', 'host.example.com']
+            pool += address_aliases[-2:]
+            address_aliases.append(name)
+            alias_type = 'host'
+        addresses = ' '.join(rng.sample(pool, k=rng.randint(1, len(pool))))
+        out.append(f'<alias><name>{name}</name><type>{alias_type}</type><address>{addresses}</address></alias>')
+    out.append('</aliases><filter>')
+
+    def direction(tag):
+        value = rng.random()
+        if value < 0.25:
+            out.append(f'<{tag}><any></any>')
+        elif value < 0.4:
+            out.append(f'<{tag}><network>{rng.choice(INTERFACES + ["lanip", "(self)"])}</network>')
+        elif value < 0.65:
+            out.append(f'<{tag}><address>{rng.choice(address_aliases)}</address>')
+        else:
+            mask = rng.choice(['', '/32', '/24', '/16'])
+            out.append(f'<{tag}><address>10.{rng.randint(0, 3)}.{rng.randint(0, 5)}.{rng.randint(0, 255)}{mask}</address>')
+        if rng.random() < 0.1:
+            out.append('<not></not>')
+        if tag == 'destination' and rng.random() < 0.6:
+            out.append(f'<port>{rng.choice(port_aliases + ["22", "443", "1000-2000", "1500:1600", "80"])}</port>')
+        out.append(f'</{tag}>')
+
+    for num in range(rules):
+        out.append(f'<rule><tracker>{1000 + num}</tracker><type>{rng.choice(["pass", "block", "reject"])}</type>')
+        if rng.random() < 0.2:
+            out.append('<floating>yes</floating>' + ('<quick>yes</quick>' if rng.random() < 0.5 else ''))
+            out.append(f'<interface>{",".join(rng.sample(INTERFACES, k=rng.randint(1, 3)))}</interface>')
+        else:
+            out.append(f'<interface>{rng.choice(INTERFACES)}</interface>')
+        direction('source')
+        direction('destination')
+        if rng.random() < 0.1:
+            out.append('<disabled></disabled>')
+        out.append(f'<descr>Rule {num} {rng.choice(["ssh", "web", "db"])}</descr></rule>')
+    out.append('</filter></pfsense>')
+    return ''.join(out)
+
+
+def generate_queries(rng, seed, count=150):
+    """
+    Формирует поисковые запросы по source/destination/port со всеми методами,
+    включая any (0.0.0.0), сети, диапазоны портов и адреса интерфейсов pfSense.
+    """
+    def address():
+        return rng.choice([
+            f'10.{rng.randint(0, 3)}.{rng.randint(0, 5)}.{rng.randint(0, 255)}',
+            f'10.{rng.randint(0, 3)}.{rng.randint(0, 5)}.0/24',
+            f'10.{seed}.{rng.randint(0, 6)}.{rng.choice([1, 7])}',
+            '192.168.10.1', '0.0.0.0', '0.0.0.0/0', '10.0.0.0/8',
+        ])
+
+    def port():
+        return rng.choice(['22', '80', '443', '1000', '1550', '2500', '1000-2000', '1500:1600', '1200-1300', '9999'])
+
+    queries = []
+    for _ in range(count):
+        fields = []
+        if rng.random() < 0.6:
+            fields.append(f'src{rng.choice(["", "=", "!"])}={address()}')
+        if rng.random() < 0.6:
+            fields.append(f'dst{rng.choice(["", "=", "!"])}={address()}')
+        if rng.random() < 0.5:
+            fields.append(f'port{rng.choice(["", "=", "!"])}={port()}')
+        if rng.random() < 0.1:
+            fields.append(f'act={rng.choice(["pass", "block"])}')
+        queries.append(' '.join(fields) or f'port={port()}')
+    return queries
+
+
+@pytest.fixture(scope='module')
+def pfs():
+    rng = random.Random(4)
+    pfs = []
+    for seed in range(4):
+        pf = PFSense(name=f'pf{seed}', ip=f'192.0.2.{seed}')
+        pf.config = RulesPFSense(generate_config(rng, seed))
+        pfs.append(pf)
+    return tuple(pfs)
+
+
+def test_search_matches_linear_scan(pfs):
+    """
+    Поиск по индексам адресов и портов находит те же правила, что и проверка каждого правила.
+    """
+    rng = random.Random(7)
+    for seed, pf in enumerate(pfs):
+        for query in generate_queries(rng, seed):
+            parsed, _ = parse_search_query(query, COMMANDS)
+            compiled = CompiledQuery(parsed)
+            for home in (True, False):
+                expected = [rule for rule in pf.config.ordered if compiled.match_rule(rule, home)]
+                assert search_rules(pf, compiled, home) == expected, f'{pf.name}: {query} (home={home})'
+
+
+def test_home_index_matches_interface_networks(pfs):
+    """
+    Домашние pfSense по индексу совпадают с проверкой сетей интерфейсов каждого pfSense.
+    """
+    rng = random.Random(11)
+    index = HomeIndex.get(pfs)
+    for _ in range(300):
+        ip = f'10.{rng.randint(0, 4)}.{rng.randint(0, 7)}.{rng.randint(0, 255)}{rng.choice(["", "/32", "/24", "/16"])}'
+        ip_query = IPQuery(ip)
+        version, first, last, _ = ip_query.range
+        expected = {
+            position for position, pf in enumerate(pfs)
+            if any(version == net_version and net_first <= first and last <= net_last
+                   for net_version, net_first, net_last, _ in pf.get_home_networks())
+        }
+        assert index.homes(ip_query) == expected, ip
+
+
+def test_home_index_includes_router_without_rules():
+    """
+    pfSense без правил фильтрации (пустая модель правил) остаётся в индексе домашних pfSense.
+    """
+    pf = PFSense(name='empty', ip='192.0.2.10')
+    pf.config = RulesPFSense('<pfsense><interfaces><lan><if>vtnet0</if><descr>LAN</descr>'
+                             '<ipaddr>10.20.0.1</ipaddr><subnet>24</subnet></lan></interfaces>'
+                             '<aliases></aliases><filter></filter></pfsense>')
+    assert len(pf.config) == 0
+    assert HomeIndex.get((pf,)).homes(IPQuery('10.20.0.5')) == {0}
@@ -0,0 +1,124 @@
+import copy
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from modules.service import netbox
+from modules.service.netbox import NetboxAPI
+from modules.settings import DEFAULT_SETTINGS
+
+ROUTERS = ['pf-1', 'pf-2', 'pf-3', 'pf-4', 'pf-5']
+
+# Интерфейсы виртуальных машин: у pf-3 нет IP-адресов, у pf-4 нет интерфейсов
+INTERFACES = [
+    {'id': 11, 'name': 'vtnet0', 'description': 'LAN', 'virtual_machine': {'id': 1, 'name': 'pf-1'}},
+    {'id': 12, 'name': 'vtnet1', 'description': '', 'virtual_machine': {'id': 1, 'name': 'pf-1'}},
+    {'id': 21, 'name': 'vtnet0', 'description': 'DMZ', 'virtual_machine': {'id': 2, 'name': 'pf-2'}},
+    {'id': 31, 'name': 'vtnet0', 'description': 'LAN', 'virtual_machine': {'id': 3, 'name': 'pf-3'}},
+    {'id': 51, 'name': 'vtnet0', 'description': 'LAN', 'virtual_machine': {'id': 5, 'name': 'pf-5'}},
+]
+IP_ADDRESSES = [
+    {'address': '10.1.0.1/24', 'assigned_object_type': 'virtualization.vminterface', 'assigned_object_id': 11,
+     'virtual_machine': 'pf-1'},
+    {'address': '10.1.1.1/24', 'assigned_object_type': 'virtualization.vminterface', 'assigned_object_id': 12,
+     'virtual_machine': 'pf-1'},
+    {'address': '10.2.0.1/24', 'assigned_object_type': 'virtualization.vminterface', 'assigned_object_id': 21,
+     'virtual_machine': 'pf-2'},
+    # Адрес интерфейса устройства (не виртуальной машины) с тем же id не учитывается
+    {'address': '192.0.2.1/32', 'assigned_object_type': 'dcim.interface', 'assigned_object_id': 21,
+     'virtual_machine': 'pf-2'},
+    {'address': '10.5.0.1/24', 'assigned_object_type': 'virtualization.vminterface', 'assigned_object_id': 51,
+     'virtual_machine': 'pf-5'},
+]
+
+
+class StubNetbox(BaseHTTPRequestHandler):
+    """
+    NetBox API: интерфейсы и IP-адреса виртуальных машин с фильтром virtual_machine и постраничной выдачей.
+    """
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        path = url.path.rstrip('/')
+        self.requests.append((path, params))
+
+        if path.endswith('/virtualization/interfaces'):
+            items = [item for item in INTERFACES if item['virtual_machine']['name'] in params['virtual_machine']]
+        elif path.endswith('/ipam/ip-addresses'):
+            items = [{key: item[key] for key in ('address', 'assigned_object_type', 'assigned_object_id')}
+                     for item in IP_ADDRESSES if item['virtual_machine'] in params['virtual_machine']]
+        elif path.endswith('/status'):
+            items = None
+        else:
+            self.send_error(404)
+            return
+
+        if items is None:
+            body = {'netbox-version': '4.1.0'}
+        else:
+            limit = int(params.get('limit', ['50'])[0]) or 1000
+            offset = int(params.get('offset', ['0'])[0])
+            body = {'count': len(items), 'next': None, 'previous': None, 'results': items[offset:offset + limit]}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def netbox_api(tmp_path, monkeypatch):
+    # Кэш создаётся во временном каталоге
+    monkeypatch.chdir(tmp_path)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubNetbox)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv('NETBOX_URL', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setenv('NETBOX_TOKEN', 'token')
+    monkeypatch.setattr(NetboxAPI, 'settings', copy.deepcopy(DEFAULT_SETTINGS))
+    monkeypatch.setattr(netbox, 'NETBOX_CHUNK_SIZE', 2)
+    monkeypatch.setattr(StubNetbox, 'requests', [])
+    assert NetboxAPI.create_connection()
+    yield StubNetbox.requests
+    server.shutdown()
+    server.server_close()
+
+
+def addresses(networks):
+    return {name: [(item.interface, item.descr, item.address) for item in items] for name, items in networks.items()}
+
+
+def test_get_networks_joins_interfaces_and_addresses_by_chunks(netbox_api):
+    networks = NetboxAPI.get_networks(ROUTERS)
+
+    assert addresses(networks) == {
+        'pf-1': [('vtnet0', 'LAN', '10.1.0.1/24'), ('vtnet1', 'vtnet1', '10.1.1.1/24')],
+        'pf-2': [('vtnet0', 'DMZ', '10.2.0.1/24')],
+        'pf-3': [],
+        'pf-4': [],
+        'pf-5': [('vtnet0', 'LAN', '10.5.0.1/24')],
+    }
+    # Один запрос интерфейсов и один запрос IP-адресов на каждые NETBOX_CHUNK_SIZE виртуальных машин
+    for endpoint in ('/virtualization/interfaces', '/ipam/ip-addresses'):
+        chunks = [params['virtual_machine'] for path, params in netbox_api if path.endswith(endpoint)]
+        assert chunks == [['pf-1', 'pf-2'], ['pf-3', 'pf-4'], ['pf-5']]
+
+
+def test_get_networks_uses_cache_covering_all_routers(netbox_api):
+    NetboxAPI.get_networks(ROUTERS)
+    netbox_api.clear()
+
+    assert addresses(NetboxAPI.get_networks(ROUTERS[:3]))['pf-1'][0] == ('vtnet0', 'LAN', '10.1.0.1/24')
+    assert netbox_api == []
+
+    NetboxAPI.get_networks(ROUTERS + ['pf-6'])
+    assert netbox_api != []
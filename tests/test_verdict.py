@@ -0,0 +1,72 @@
+import pytest
+
+from modules.rule.verdict import Flow, check_flow, flow_verdict
+from modules.service.pfsense import PFSense, RulesPFSense
+
+CONFIG = '''<pfsense>
+<interfaces>
+    <lan><if>em1</if><descr>LAN</descr><ipaddr>10.0.0.1</ipaddr><subnet>24</subnet></lan>
+    <opt1><if>em2</if><descr>DMZ</descr><ipaddr>10.1.0.1</ipaddr><subnet>24</subnet></opt1>
+    <wan><if>em0</if><descr>WAN</descr><ipaddr>198.51.100.2</ipaddr><subnet>29</subnet></wan>
+</interfaces>
+<aliases>
+    <alias><name>names</name><type>host</type><address>host.example.com 10.9.9.9</address></alias>
+    <alias><name>pool</name><type>host</type><address>10.1.0.100-10.1.0.110</address></alias>
+</aliases>
+<filter>
+    <rule><tracker>1</tracker><type>pass</type><interface>lan</interface><protocol>tcp</protocol>
+        <source><any/><port>5000</port></source><destination><any/><port>22</port></destination></rule>
+    <rule><tracker>2</tracker><type>pass</type><interface>lan</interface><protocol>tcp</protocol>
+        <source><any/></source><destination><network>lanip</network><port>8443</port></destination></rule>
+    <rule><tracker>3</tracker><type>block</type><interface>lan</interface>
+        <source><any/></source><destination><network>(self)</network></destination></rule>
+    <rule><tracker>4</tracker><type>pass</type><interface>lan</interface>
+        <source><any/></source><destination><address>names</address></destination></rule>
+    <rule><tracker>5</tracker><type>block</type><interface>lan</interface>
+        <source><any/></source><destination><address>pool</address></destination></rule>
+    <rule><tracker>6</tracker><type>pass</type><interface>lan</interface>
+        <source><any/></source><destination><any/></destination></rule>
+</filter>
+</pfsense>'''
+
+
+@pytest.fixture(scope='module')
+def pf():
+    pf = PFSense(name='pf', ip='192.0.2.1')
+    pf.config = RulesPFSense(CONFIG)
+    return pf
+
+
+@pytest.mark.parametrize('flow, tracker, indeterminate', [
+    # Порт источника: правило 1 решает только для потока с портом источника 5000
+    ({'dst': '10.1.0.50', 'port': 22, 'sport': 40000}, '6', ['4']),
+    ({'dst': '10.1.0.50', 'port': 22, 'sport': 5000}, '1', []),
+    ({'dst': '10.1.0.50', 'port': 22}, '6', ['1', '4']),
+    # (self) - адреса всех интерфейсов pfSense, lanip - адрес интерфейса LAN
+    ({'dst': '10.1.0.1', 'port': 443, 'sport': 40000}, '3', []),
+    ({'dst': '198.51.100.2', 'port': 443, 'sport': 40000}, '3', []),
+    ({'dst': '10.0.0.1', 'port': 8443, 'sport': 40000}, '2', []),
+    # Правило с условием на порт или протокол не решает судьбу потока без них
+    ({'dst': '10.0.0.1', 'sport': 40000}, '3', ['2']),
+    ({'dst': '10.0.0.1', 'proto': None, 'port': 8443, 'sport': 40000}, '3', ['2']),
+    # Адрес из алиаса решает, FQDN из того же алиаса - не определён
+    ({'dst': '10.9.9.9', 'proto': 'udp', 'port': 53}, '4', []),
+    ({'dst': '10.1.0.105', 'proto': 'udp', 'port': 53}, '5', ['4']),
+    ({'dst': '10.50.0.1', 'proto': 'udp', 'port': 53}, '6', ['4']),
+])
+def test_flow_verdict(pf, flow, tracker, indeterminate):
+    ingress, rule, undecided = flow_verdict(pf, Flow(src='10.0.0.5', proto=flow.get('proto', 'tcp'),
+                                                     dst=flow['dst'], port=flow.get('port'), sport=flow.get('sport')))
+    assert ingress == 'lan'
+    assert rule.tracker == tracker
+    assert [item.tracker for item in undecided] == indeterminate
+
+
+def test_check_flow_reports_unknown_ingress(pf):
+    result = check_flow((pf,), {'src': '172.16.0.1', 'dst': '10.1.0.50', 'proto': 'tcp', 'port': 22})
+    assert result['rows'] == []
+    assert result['unknown_ingress'] == ['pf']
+
+    result = check_flow((pf,), {'src': '10.0.0.5', 'dst': '10.1.0.50', 'proto': 'tcp', 'port': 22, 'sport': 5000})
+    assert [(row['pf'], row['verdict'], row['rule']['tracker']) for row in result['rows']] == [('pf', 'pass', '1')]
+    assert result['unknown_ingress'] == []